@@ -7,34 +7,21 @@ Muestra cómo cambian las propiedades físicas con el tiempo
 import numpy as np
 import matplotlib.pyplot as plt
 import glob
+import os
+import sys
+from multiprocessing import Pool
 
-def read_snapshot(filename):
-    """Lee un snapshot y retorna datos de partículas"""
-    with open(filename, 'r') as f:
-        lines = f.readlines()
-
-    snapshot_id = int(lines[0].strip())
-    n_particles = int(lines[1].strip())
-    time = float(lines[2].strip())
-
-    particles = []
-    for i in range(3, len(lines)):
-        data = lines[i].split()
-        if len(data) >= 8:
-            particles.append([
-                int(data[0]),      # id
-                float(data[1]),    # mass
-                float(data[2]),    # x
-                float(data[3]),    # y
-                float(data[4]),    # z
-                float(data[5]),    # vx
-                float(data[6]),    # vy
-                float(data[7])     # vz
-            ])
-
-    return snapshot_id, n_particles, time, np.array(particles)
-
-def analyze_cluster(particles):
+from cluster_analysis import centre_of_mass, lagrangian_radii
+from barnes_hut import unbound_fraction
+from density_centre import density_centre
+from results_table import ResultsTable, column
+from run_store import SNAPSHOT_PATTERN
+from snapshot_io import read_snapshot
+
+# Subir al cambiar analyze_cluster: invalida los resultados guardados
+ANALYSIS_VERSION = 1
+
+def analyze_cluster(pos, vel, mass, theta=None):
     """
     Calcula propiedades físicas del cúmulo:
     - Radio del núcleo (core radius)
@@ -42,41 +29,31 @@ def analyze_cluster(particles):
     - Radio de marea (tidal radius)
     - Dispersión de velocidades
     - Densidad central
+    El centro, el radio del núcleo y la densidad central siguen a
+    Casertano & Hut (1985); los radios medio y externo son lagrangianos
+    (ponderados por masa) alrededor de ese centro.
+    Con theta, además la fracción de masa no ligada (potencial Barnes-Hut
+    con ese ángulo de apertura; suma directa exacta para N < 12000).
     """
-    # Posiciones y velocidades
-    pos = particles[:, 2:5]
-    vel = particles[:, 5:8]
-
-    # Distancias desde el centro
-    r = np.sqrt(np.sum(pos**2, axis=1))
-
-    # Velocidades
-    v = np.sqrt(np.sum(vel**2, axis=1))
+    # Centro de densidad, radio del núcleo y densidad central (vecinos k=6)
+    centre, r_core, density_core = density_centre(pos, mass)
 
-    # Radio que contiene el 10% de las partículas (core radius)
-    r_sorted = np.sort(r)
-    n_10 = int(0.1 * len(r))
-    r_core = r_sorted[n_10]
+    # Radios que contienen el 10%, 50% y 90% de la masa
+    (r_10, r_half, r_tidal), _ = lagrangian_radii(pos, mass, (0.1, 0.5, 0.9), centre=centre)
 
-    # Radio medio (half-mass radius)
-    n_50 = int(0.5 * len(r))
-    r_half = r_sorted[n_50]
+    # Distancias desde el centro
+    r = np.sqrt(np.sum((pos - centre)**2, axis=1))
 
-    # Radio que contiene el 90% (tidal radius aproximado)
-    n_90 = int(0.9 * len(r))
-    r_tidal = r_sorted[n_90]
+    # Velocidades respecto al centro de masa
+    v = np.sqrt(np.sum((vel - centre_of_mass(vel, mass))**2, axis=1))
 
     # Dispersión de velocidades
     v_mean = np.mean(v)
     v_std = np.std(v)
 
-    # Densidad central (partículas dentro de r_core)
-    n_core = np.sum(r < r_core)
-    volume_core = (4/3) * np.pi * r_core**3
-    density_core = n_core / volume_core if volume_core > 0 else 0
-
-    return {
+    props = {
         'r_core': r_core,
+        'r_10': r_10,
         'r_half': r_half,
         'r_tidal': r_tidal,
         'v_mean': v_mean,
@@ -85,56 +62,70 @@ def analyze_cluster(particles):
         'r_max': r.max(),
         'r_mean': r.mean()
     }
-
-def plot_evolution():
+    if theta is not None:
+        props['unbound'] = unbound_fraction(pos, vel, mass, theta=theta)
+    return props
+
+def analyze_snapshot(args):
+    """Analiza un archivo de snapshot (se ejecuta en un proceso del pool)"""
+    filename, theta = args
+    diskstep, nbody, time, particles = read_snapshot(filename)
+    props = analyze_cluster(particles['pos'], particles['vel'], particles['mass'], theta=theta)
+    props['nbody'] = nbody
+    props['theta'] = theta
+    return filename, time, props
+
+def plot_evolution(theta=None):
     """
     Grafica la evolución temporal del cúmulo
+    theta: si se indica, calcula también la masa no ligada (Barnes-Hut)
     """
-    snapshot_files = sorted(glob.glob('../outputs/[0-9][0-9][0-9][0-9].dat'))
-
-    if len(snapshot_files) < 2:
+    # Resultados por snapshot guardados entre ejecuciones; solo se
+    # analizan los snapshots nuevos o modificados
+    files = sorted(glob.glob(os.path.join('../outputs', SNAPSHOT_PATTERN)))
+    table = ResultsTable('../outputs', 'evolution', version=ANALYSIS_VERSION)
+    pending = [f for f in files
+               if table.get(f) is None
+               or (theta is not None and table.get(f)['values'].get('theta') != theta)]
+
+    if len(files) < 2:
         print("Se necesitan al menos 2 snapshots para ver evolución")
         return
 
-    print(f"Analizando {len(snapshot_files)} snapshots...")
-
-    # Arrays para almacenar evolución temporal
-    times = []
-    r_cores = []
-    r_halfs = []
-    r_tidals = []
-    v_stds = []
-    densities = []
-    n_particles = []
-
-    for filename in snapshot_files:
-        snap_id, n_parts, time, particles = read_snapshot(filename)
-        props = analyze_cluster(particles)
-
-        times.append(time)
-        r_cores.append(props['r_core'])
-        r_halfs.append(props['r_half'])
-        r_tidals.append(props['r_tidal'])
-        v_stds.append(props['v_std'])
-        densities.append(props['density_core'])
-        n_particles.append(n_parts)
-
-        print(f"t={time:.2f}: r_core={props['r_core']:.3f}, "
-              f"r_half={props['r_half']:.3f}, σ_v={props['v_std']:.3f}")
-
-    times = np.array(times)
-    r_cores = np.array(r_cores)
-    r_halfs = np.array(r_halfs)
-    r_tidals = np.array(r_tidals)
-    v_stds = np.array(v_stds)
-    densities = np.array(densities)
+    print(f"Analizando {len(pending)} de {len(files)} snapshots "
+          f"({len(files) - len(pending)} ya calculados)...")
+
+    # Snapshots pendientes en paralelo, un proceso por núcleo; cada
+    # resultado se guarda en cuanto llega
+    if pending:
+        with Pool() as pool:
+            for filename, time, props in pool.imap_unordered(
+                    analyze_snapshot, [(f, theta) for f in pending]):
+                table.put(filename, time, props)
+                table.save()
+    rows = table.select(files)
+
+    for row in rows:
+        props = row['values']
+        print(f"t={row['time']:.2f}: r_core={props['r_core']:.3f}, "
+              f"r_half={props['r_half']:.3f}, σ_v={props['v_std']:.3f}"
+              + (f", no ligada={props['unbound'] * 100:.2f}%" if 'unbound' in props else ""))
+
+    # Arrays de la evolución temporal
+    times = np.array([row['time'] for row in rows])
+    r_cores = column(rows, 'r_core')
+    r_halfs = column(rows, 'r_half')
+    r_tidals = column(rows, 'r_tidal')
+    v_stds = column(rows, 'v_std')
+    densities = column(rows, 'density_core')
+    unbound = column(rows, 'unbound')
 
     # Crear gráficos
     fig, axes = plt.subplots(2, 2, figsize=(14, 10))
 
     # 1. Evolución de radios
     ax = axes[0, 0]
-    ax.plot(times, r_cores, 'b-', linewidth=2, label='Radio del núcleo (10%)')
+    ax.plot(times, r_cores, 'b-', linewidth=2, label='Radio del núcleo (Casertano-Hut)')
     ax.plot(times, r_halfs, 'g-', linewidth=2, label='Radio medio (50%)')
     ax.plot(times, r_tidals, 'r-', linewidth=2, label='Radio externo (90%)')
     ax.set_xlabel('Tiempo', fontsize=12)
@@ -199,6 +190,11 @@ def plot_evolution():
     print(f"  Inicial: {concentration[0]:.4f}")
     print(f"  Final:   {concentration[-1]:.4f}")
     print(f"  Cambio:  {(concentration[-1]/concentration[0] - 1)*100:+.2f}%")
+
+    if theta is not None:
+        print(f"\nMasa no ligada (Barnes-Hut, θ={theta}):")
+        print(f"  Inicial: {unbound[0] * 100:.2f}%")
+        print(f"  Final:   {unbound[-1] * 100:.2f}%")
     print("="*60)
 
     # Interpretación
@@ -214,4 +210,9 @@ def plot_evolution():
         print("✅ El cúmulo permanece en equilibrio virial")
 
 if __name__ == '__main__':
-    plot_evolution()
+    # --unbound [theta]: añade la fracción de masa no ligada
+    theta = None
+    if '--unbound' in sys.argv:
+        i = sys.argv.index('--unbound')
+        theta = float(sys.argv[i + 1]) if len(sys.argv) > i + 1 else 0.5
+    plot_evolution(theta)
@@ -5,6 +5,7 @@ Análisis completo de performance para proyecto HPC
 """
 
 import subprocess
+import sys
 import time
 import numpy as np
 import matplotlib
@@ -14,10 +15,78 @@ import json
 import os
 from datetime import datetime
 
+from ic_cache import get_or_generate
+
+# Flops por interacción del integrador Hermite de 4º orden (hermite4.h)
+FLOPS_PER_INTERACTION = 60
+
+# Umbral del z-score modificado (mediana/MAD) para rechazar atípicos
+OUTLIER_THRESHOLD = 3.5
+
+
+def reject_outliers(samples, threshold=OUTLIER_THRESHOLD):
+    """
+    Separa las muestras atípicas con el z-score modificado
+    0.6745 * |x - mediana| / MAD (Iglewicz y Hoaglin). Si MAD = 0 (más
+    de la mitad de las muestras iguales) usa la desviación absoluta
+    media: 0.7979 * |x - mediana| / MeanAD.
+    Retorna: (muestras válidas, atípicas)
+    """
+    samples = np.asarray(samples, dtype=np.float64)
+    median = np.median(samples)
+    deviation = np.abs(samples - median)
+    mad = np.median(deviation)
+    if mad > 0:
+        score = 0.6745 * deviation / mad
+    else:
+        mean_ad = np.mean(deviation)
+        if mean_ad == 0:
+            return samples, samples[:0]
+        score = 0.7979 * deviation / mean_ad
+    outlier = score > threshold
+    return samples[~outlier], samples[outlier]
+
+
+def bootstrap_ci(samples, confidence=0.95, n_boot=2000, seed=0):
+    """Intervalo de confianza bootstrap (percentiles) de la mediana"""
+    samples = np.asarray(samples, dtype=np.float64)
+    rng = np.random.default_rng(seed)
+    medians = np.median(samples[rng.integers(0, len(samples), (n_boot, len(samples)))], axis=1)
+    alpha = (1.0 - confidence) / 2.0
+    lo, hi = np.quantile(medians, [alpha, 1.0 - alpha])
+    return [float(lo), float(hi)]
+
+
+def bootstrap_ratio_ci(base, samples, confidence=0.95, n_boot=2000, seed=0):
+    """
+    Intervalo de confianza bootstrap de mediana(base) / mediana(samples),
+    remuestreando ambas series de forma independiente (speedup)
+    """
+    base = np.asarray(base, dtype=np.float64)
+    samples = np.asarray(samples, dtype=np.float64)
+    rng = np.random.default_rng(seed)
+    num = np.median(base[rng.integers(0, len(base), (n_boot, len(base)))], axis=1)
+    den = np.median(samples[rng.integers(0, len(samples), (n_boot, len(samples)))], axis=1)
+    alpha = (1.0 - confidence) / 2.0
+    lo, hi = np.quantile(num / den, [alpha, 1.0 - alpha])
+    return [float(lo), float(hi)]
+
+
+def error_bars(results, key):
+    """Barras de error asimétricas (abajo, arriba) a partir de key_ci"""
+    values = np.array([r[key] for r in results], dtype=np.float64)
+    ci = np.array([r[f'{key}_ci'] for r in results], dtype=np.float64)
+    return [values - ci[:, 0], ci[:, 1] - values]
+
 
 class NBenchmark:
-    def __init__(self):
+    def __init__(self, seed=42, warmup=1, repetitions=5, confidence=0.95):
         self.results = []
+        self.seed = seed
+        # Ejecuciones descartadas antes de medir (caché de disco, páginas, MPI)
+        self.warmup = warmup
+        self.repetitions = repetitions
+        self.confidence = confidence
         self.system_info = self.get_system_info()
         
     def get_system_info(self):
@@ -36,9 +105,36 @@ class NBenchmark:
         }
     
     
+    def run_command(self, cmd):
+        """
+        Ejecuta el binario una vez y mide su tiempo de pared con perf_counter_ns
+        Retorna: (tiempo en segundos, resultado) o (None, None) si falla
+        """
+        try:
+            # cwd=".." porque el script está en benchmarks/ y el binario en raíz
+            start_ns = time.perf_counter_ns()
+            result = subprocess.run(cmd, shell=True, capture_output=True, text=True, timeout=3600, cwd="..")
+            elapsed = (time.perf_counter_ns() - start_ns) * 1e-9
+        except subprocess.TimeoutExpired:
+            print(f"⏰ Timeout después de 1 hora")
+            return None, None
+        except Exception as e:
+            print(f"❌ Error: {e}")
+            return None, None
+
+        if result.returncode != 0:
+            print(f"❌ Error en ejecución: {result.stderr}")
+            return None, None
+        return elapsed, result
+
     def run_single_benchmark(self, processes, config_file, label=""):
-        """Ejecuta un benchmark individual"""
-        print(f"🔄 Ejecutando: P={processes}, Config={config_file}")
+        """
+        Ejecuta un benchmark: self.warmup ejecuciones descartadas y luego
+        self.repetitions medidas. wall_time es la mediana de las
+        repeticiones que no son atípicas, con su IC bootstrap.
+        """
+        print(f"🔄 Ejecutando: P={processes}, Config={config_file} "
+              f"({self.warmup} calentamiento + {self.repetitions} repeticiones)")
         
         # Comando MPI (phi-GPU.cpp ahora acepta config como argumento, sin redirección <)
         if processes == 1:
@@ -46,39 +142,41 @@ class NBenchmark:
         else:
             cmd = f"mpirun -n {processes} ./cpu-4th {config_file}"
         
-        # Medir tiempo
-        start_time = time.time()
+        for _ in range(self.warmup):
+            elapsed, result = self.run_command(cmd)
+            if result is None:
+                return None
         
-        try:
-            # cwd=".." porque el script está en benchmarks/ y el binario en raíz
-            result = subprocess.run(cmd, shell=True, capture_output=True, text=True, timeout=3600, cwd="..")
-            end_time = time.time()
-            
-            if result.returncode != 0:
-                print(f"❌ Error en ejecución: {result.stderr}")
+        samples = []
+        for k in range(self.repetitions):
+            elapsed, result = self.run_command(cmd)
+            if result is None:
                 return None
-                
-            wall_time = end_time - start_time
-            
-            # Parsear salida para obtener métricas
-            metrics = self.parse_output(result.stdout, result.stderr)
-            metrics.update({
-                'processes': processes,
-                'wall_time': wall_time,
-                'config': config_file,
-                'label': label,
-                'success': True
-            })
-            
-            print(f"✅ Completado en {wall_time:.2f}s")
-            return metrics
-            
-        except subprocess.TimeoutExpired:
-            print(f"⏰ Timeout después de 1 hora")
-            return None
-        except Exception as e:
-            print(f"❌ Error: {e}")
-            return None
+            samples.append(elapsed)
+            print(f"   {k + 1}/{self.repetitions}: {elapsed:.3f}s")
+        
+        kept, outliers = reject_outliers(samples)
+        wall_time = float(np.median(kept))
+        
+        # Parsear salida (la de la última repetición) para obtener métricas
+        metrics = self.parse_output(result.stdout, result.stderr)
+        metrics.update({
+            'processes': processes,
+            'wall_time': wall_time,
+            'wall_time_ci': bootstrap_ci(kept, self.confidence),
+            'wall_times': [float(t) for t in kept],
+            'outliers': [float(t) for t in outliers],
+            'warmup': self.warmup,
+            'repetitions': self.repetitions,
+            'config': config_file,
+            'label': label,
+            'success': True
+        })
+        
+        print(f"✅ Mediana {wall_time:.3f}s, IC {self.confidence * 100:.0f}% "
+              f"[{metrics['wall_time_ci'][0]:.3f}, {metrics['wall_time_ci'][1]:.3f}]"
+              f"{f', {len(outliers)} atípicos descartados' if len(outliers) else ''}")
+        return metrics
     
     def parse_output(self, stdout, stderr):
         """Extrae métricas de la salida del programa"""
@@ -88,6 +186,7 @@ class NBenchmark:
         cpu_time = 0
         energy_error = 0
         timesteps = 0
+        n_act_sum = None
         
         for line in lines:
             if 'CPU_time_user' in line or len(line.split()) >= 8:
@@ -107,16 +206,20 @@ class NBenchmark:
                 except:
                     continue
             
-            # Capturar Timesteps explícitamente
+            # Capturar Timesteps y la suma de partículas integradas explícitamente
+            # "Timesteps = T   Total sum of integrated part. = S   n_act average = A"
             if "Timesteps =" in line:
                 try:
-                    timesteps = float(line.split('=')[1].split()[0])
+                    fields = line.split('=')
+                    timesteps = float(fields[1].split()[0])
+                    n_act_sum = float(fields[2].split()[0])
                 except: pass
 
         return {
             'cpu_time': cpu_time,
             'energy_error': energy_error,
-            'timesteps': timesteps
+            'timesteps': timesteps,
+            'n_act_sum': n_act_sum
         }
     
     def strong_scaling_benchmark(self, process_list=[1, 2, 4, 8], n_particles=4096):
@@ -182,15 +285,13 @@ class NBenchmark:
         return results
     
     def generate_plummer_data(self, n_particles, output_path):
-        """Genera datos Plummer usando gen-plum.c (binario compilado)"""
-        # output_path es relativo a benchmarks/ donde corre el script?
-        # No, el argumento pasado debe ser correcto desde donde se llamó.
-        # weak_scaling pasa "../dat/file.inp". 
-        
-        # El binario está en ../gen-plum (desde benchmarks/)
-        cmd = f"../gen-plum {n_particles} > {output_path}"
+        """Genera datos Plummer reproducibles, reutilizando el caché de ICs"""
+        # output_path es relativo a benchmarks/ (p.ej. "../dat/file.inp").
+        # Mismo (modelo, N, semilla, versión) -> mismo archivo: solo se genera
+        # la primera vez y luego se enlaza desde el caché.
         try:
-            subprocess.run(cmd, shell=True, check=True)
+            hit = get_or_generate('plummer', n_particles, output_path, seed=self.seed)
+            print(f"{'♻️  Reutilizado del caché' if hit else '🆕 Generado'}: {output_path}")
         except Exception as e:
             print(f"❌ Error generando datos: {e}")
     
@@ -203,30 +304,45 @@ class NBenchmark:
             f.write(config_content)
     
     def calculate_metrics(self, results):
-        """Calcula métricas de performance"""
+        """
+        Calcula métricas de performance con sus intervalos de confianza
+        (bootstrap de la razón de medianas para speedup y eficiencia)
+        """
         if not results:
             return {}
         
-        # Tiempo base (P=1)
-        base_time = None
+        # Muestras base (P=1)
+        base = None
         for r in results:
             if r['processes'] == 1:
-                base_time = r['wall_time']
+                base = r
                 break
         
-        if base_time is None:
-            base_time = results[0]['wall_time']
+        if base is None:
+            base = results[0]
         
         # Calcular speedup y eficiencia
         for r in results:
-            r['speedup'] = base_time / r['wall_time']
+            r['speedup'] = base['wall_time'] / r['wall_time']
+            if r is base:
+                # La base contra sí misma es 1 por definición
+                r['speedup_ci'] = [1.0, 1.0]
+            else:
+                r['speedup_ci'] = bootstrap_ratio_ci(base['wall_times'], r['wall_times'], self.confidence)
             r['efficiency'] = r['speedup'] / r['processes'] * 100
+            r['efficiency_ci'] = [s / r['processes'] * 100 for s in r['speedup_ci']]
             
-            # FLOPS estimados (20 FLOPS por interacción)
+            # FLOPS como los cuenta el programa ("Real Speed"): cada partícula
+            # activa interactúa con las N del sistema en cada paso de bloque
             n_particles = r.get('particles', 5120)
-            flops_per_step = n_particles**2 * 20 + n_particles * 60
-            total_flops = flops_per_step * r.get('timesteps', 1000)
-            r['gflops'] = total_flops / (r['wall_time'] * 1e9)
+            if r.get('n_act_sum'):
+                total_flops = FLOPS_PER_INTERACTION * n_particles * r['n_act_sum']
+                r['gflops'] = total_flops / (r['wall_time'] * 1e9)
+                lo, hi = r['wall_time_ci']
+                r['gflops_ci'] = [total_flops / (hi * 1e9), total_flops / (lo * 1e9)]
+            else:
+                r['gflops'] = None
+                r['gflops_ci'] = None
         
         return results
     
@@ -241,7 +357,7 @@ class NBenchmark:
         wall_time = [r['wall_time'] for r in results]
         speedup = [r['speedup'] for r in results]
         efficiency = [r['efficiency'] for r in results]
-        gflops = [r['gflops'] for r in results]
+        with_gflops = [r for r in results if r['gflops'] is not None]
         
         # Crear figura con subplots
         fig, axes = plt.subplots(2, 2, figsize=(15, 12))
@@ -249,7 +365,8 @@ class NBenchmark:
         
         # 1. Tiempo vs Procesos
         ax = axes[0, 0]
-        ax.plot(processes, wall_time, 'bo-', linewidth=2, markersize=8)
+        ax.errorbar(processes, wall_time, yerr=error_bars(results, 'wall_time'), fmt='bo-',
+                    linewidth=2, markersize=8, capsize=4)
         ax.set_xlabel('Número de Procesos')
         ax.set_ylabel('Tiempo (segundos)')
         ax.set_title('Tiempo de Ejecución')
@@ -258,7 +375,8 @@ class NBenchmark:
         
         # 2. Speedup vs Procesos
         ax = axes[0, 1]
-        ax.plot(processes, speedup, 'ro-', linewidth=2, markersize=8, label='Speedup Real')
+        ax.errorbar(processes, speedup, yerr=error_bars(results, 'speedup'), fmt='ro-',
+                    linewidth=2, markersize=8, capsize=4, label='Speedup Real')
         ax.plot(processes, processes, 'k--', alpha=0.5, label='Speedup Ideal')
         ax.set_xlabel('Número de Procesos')
         ax.set_ylabel('Speedup')
@@ -268,7 +386,8 @@ class NBenchmark:
         
         # 3. Eficiencia vs Procesos
         ax = axes[1, 0]
-        ax.plot(processes, efficiency, 'go-', linewidth=2, markersize=8)
+        ax.errorbar(processes, efficiency, yerr=error_bars(results, 'efficiency'), fmt='go-',
+                    linewidth=2, markersize=8, capsize=4)
         ax.axhline(y=80, color='r', linestyle='--', alpha=0.5, label='80% Eficiencia')
         ax.set_xlabel('Número de Procesos')
         ax.set_ylabel('Eficiencia (%)')
@@ -278,7 +397,10 @@ class NBenchmark:
         
         # 4. GFLOPS vs Procesos
         ax = axes[1, 1]
-        ax.plot(processes, gflops, 'mo-', linewidth=2, markersize=8)
+        if with_gflops:
+            ax.errorbar([r['processes'] for r in with_gflops], [r['gflops'] for r in with_gflops],
+                        yerr=error_bars(with_gflops, 'gflops'), fmt='mo-', linewidth=2,
+                        markersize=8, capsize=4)
         ax.set_xlabel('Número de Procesos')
         ax.set_ylabel('GFLOPS')
         ax.set_title('Rendimiento Computacional')
@@ -309,12 +431,27 @@ class NBenchmark:
 
 ### 📈 Resultados de Benchmarking
 
-| Procesos | Tiempo (s) | Speedup | Eficiencia (%) | GFLOPS | Error Energía |
-|----------|------------|---------|----------------|--------|---------------|
+Mediana de {self.repetitions} repeticiones tras {self.warmup} de calentamiento
+(tiempo con `perf_counter_ns`); entre corchetes el intervalo de confianza
+bootstrap del {self.confidence * 100:.0f}%. Las repeticiones atípicas
+(z-score modificado > {OUTLIER_THRESHOLD}) se descartan.
+
+| Procesos | Tiempo (s) | Speedup | Eficiencia (%) | GFLOPS | Repeticiones | Error Energía |
+|----------|------------|---------|----------------|--------|--------------|---------------|
 """
         
+        def with_ci(row, key, fmt):
+            if row[key] is None:
+                return '-'
+            lo, hi = row[f'{key}_ci']
+            return f"{row[key]:{fmt}} [{lo:{fmt}}, {hi:{fmt}}]"
+        
         for row in results:
-            report += f"| {row['processes']} | {row['wall_time']:.2f} | {row['speedup']:.2f} | {row['efficiency']:.1f} | {row['gflops']:.2f} | {row['energy_error']:.2e} |\n"
+            kept = len(row['wall_times'])
+            report += (f"| {row['processes']} | {with_ci(row, 'wall_time', '.3f')} | "
+                       f"{with_ci(row, 'speedup', '.2f')} | {with_ci(row, 'efficiency', '.1f')} | "
+                       f"{with_ci(row, 'gflops', '.2f')} | {kept}/{kept + len(row['outliers'])} | "
+                       f"{row['energy_error']:.2e} |\n")
         
         # Análisis
         # Find best efficiency
@@ -332,13 +469,13 @@ class NBenchmark:
 
 **Mejor Eficiencia:**
 - Procesos: {best_efficiency['processes']}
-- Eficiencia: {best_efficiency['efficiency']:.1f}%
-- Speedup: {best_efficiency['speedup']:.2f}x
+- Eficiencia: {with_ci(best_efficiency, 'efficiency', '.1f')}%
+- Speedup: {with_ci(best_efficiency, 'speedup', '.2f')}x
 
 **Mejor Speedup:**
 - Procesos: {best_speedup['processes']}
-- Speedup: {best_speedup['speedup']:.2f}x
-- Eficiencia: {best_speedup['efficiency']:.1f}%
+- Speedup: {with_ci(best_speedup, 'speedup', '.2f')}x
+- Eficiencia: {with_ci(best_speedup, 'efficiency', '.1f')}%
 
 **Escalabilidad:**
 - Eficiencia >80%: Hasta {max_efficient_procs} procesos
@@ -355,9 +492,20 @@ class NBenchmark:
         with open(f"{report_name}.md", 'w') as f:
             f.write(report)
         
-        # Guardar datos en JSON
+        # Guardar datos en JSON (con la configuración estadística usada)
         with open(f"{report_name}.json", 'w') as f:
-            json.dump(results, f, indent=2)
+            json.dump({
+                'system': self.system_info,
+                'statistics': {
+                    'warmup': self.warmup,
+                    'repetitions': self.repetitions,
+                    'confidence': self.confidence,
+                    'estimator': 'median',
+                    'interval': 'bootstrap percentile',
+                    'outlier_threshold': OUTLIER_THRESHOLD,
+                },
+                'results': results,
+            }, f, indent=2)
         
         print(f"📄 Reporte guardado: {report_name}.md")
         print(f"💾 Datos guardados: {report_name}.json")
@@ -404,7 +552,11 @@ def main():
         print("Ejecuta: make cpu-4th")
         return
     
-    benchmark = NBenchmark()
+    # Opciones: --warmup W --reps R
+    args = sys.argv[1:]
+    options = dict(zip(args[::2], args[1::2]))
+    benchmark = NBenchmark(warmup=int(options.get('--warmup', 1)),
+                           repetitions=int(options.get('--reps', 5)))
     benchmark.run_complete_benchmark()
 
 if __name__ == "__main__":
@@ -0,0 +1,322 @@
+#!/usr/bin/env python3
+"""
+Binaries and Escapers
+Bound pairs found with a uniform cell-list neighbour search (linear in
+N for a fixed search radius) instead of all pairs, with their orbital
+elements, plus escapers: particles beyond a given radius with positive
+energy. Each snapshot gets a compact catalogue in <outputs>/binaries/
+and a summary row in the "binaries" results table.
+
+Units: G = 1 (N-body units); the pair energies are unsoftened.
+"""
+
+import glob
+import os
+import sys
+from multiprocessing import Pool
+
+import numpy as np
+
+from cluster_analysis import centre_of_mass, lagrangian_radii
+from octree import ranges_to_indices
+from results_table import ResultsTable
+from run_store import SNAPSHOT_PATTERN
+from snapshot_io import read_snapshot
+
+CATALOGUE_DIR = 'binaries'
+CATALOGUE_VERSION = 1
+
+# Search radius, in units of the mean interparticle distance inside r_half
+SEARCH_FACTOR = 0.5
+# Default escaper radius, in units of r_half
+ESCAPE_FACTOR = 10.0
+# Binaries with binding energy above HARD_LIMIT * kT count as hard
+HARD_LIMIT = 1.0
+
+BINARY_DTYPE = np.dtype([
+    ('id1', np.int64), ('id2', np.int64),
+    ('m1', np.float64), ('m2', np.float64),
+    ('a', np.float64), ('e', np.float64), ('period', np.float64),
+    ('inclination', np.float64), ('e_bind', np.float64),
+    ('separation', np.float64), ('cm_pos', np.float64, (3,)),
+])
+
+ESCAPER_DTYPE = np.dtype([
+    ('id', np.int64), ('r', np.float64), ('energy', np.float64),
+])
+
+
+# Cell coordinates as one record, compared lexicographically: only used
+# when even the squeezed grid is too large for an int64 linear key
+CELL_DTYPE = np.dtype([('x', np.int64), ('y', np.int64), ('z', np.int64)])
+
+
+def squeeze_axis(c):
+    """
+    Renumber the occupied cell coordinates of one axis from 1, keeping
+    adjacent coordinates adjacent and shrinking every larger gap to 2,
+    so that neighbour offsets of +-1 still mean the same thing
+    """
+    values, inverse = np.unique(c, return_inverse=True)
+    step = np.minimum(np.diff(values), 2)
+    return np.concatenate([[1], 1 + np.cumsum(step)])[inverse.ravel()]
+
+
+def cell_keys(pos, radius):
+    """
+    Sortable key of the cell of each particle and a function giving the
+    keys of the cells offset by (dx, dy, dz). Empty stretches of space
+    (e.g. between the cluster and a distant escaper) are squeezed out,
+    so the dense key stays small; if it would still overflow int64 the
+    keys are (x, y, z) records instead.
+    """
+    grid = np.floor((pos - pos.min(axis=0)) / radius).astype(np.int64)
+    cell = np.column_stack([squeeze_axis(grid[:, k]) for k in range(3)])
+    dims = [int(d) + 2 for d in cell.max(axis=0)]
+    if dims[0] * dims[1] * dims[2] < 2**62:
+        key = (cell[:, 0] * dims[1] + cell[:, 1]) * dims[2] + cell[:, 2]
+        return key, lambda keys, dx, dy, dz: keys + (dx * dims[1] + dy) * dims[2] + dz
+
+    key = np.empty(len(pos), dtype=CELL_DTYPE)
+    key['x'], key['y'], key['z'] = cell[:, 0], cell[:, 1], cell[:, 2]
+
+    def shift(keys, dx, dy, dz):
+        target = keys.copy()
+        target['x'] += dx
+        target['y'] += dy
+        target['z'] += dz
+        return target
+
+    return key, shift
+
+
+def neighbour_pairs(pos, radius):
+    """
+    All pairs (i < j) closer than radius, from a uniform cell list of
+    cell size radius: particles are sorted by cell and each cell is
+    compared with itself and its 26 neighbours only
+    Returns: i, j (index arrays)
+    """
+    key, shift = cell_keys(pos, radius)
+    order = np.argsort(key, kind='stable')
+    sorted_keys = key[order]
+    new = np.ones(len(key), dtype=bool)
+    new[1:] = sorted_keys[1:] != sorted_keys[:-1]
+    cell_start = np.flatnonzero(new)
+    cells = sorted_keys[cell_start]
+    cell_end = np.append(cell_start[1:], len(key))
+
+    pairs_i, pairs_j = [], []
+    for dx in (-1, 0, 1):
+        for dy in (-1, 0, 1):
+            for dz in (-1, 0, 1):
+                target = shift(sorted_keys, dx, dy, dz)
+                k = np.searchsorted(cells, target)
+                k = np.minimum(k, len(cells) - 1)
+                found = cells[k] == target
+                i = np.flatnonzero(found)
+                counts = cell_end[k[i]] - cell_start[k[i]]
+                j = ranges_to_indices(cell_start[k[i]], cell_end[k[i]])
+                i = np.repeat(i, counts)
+                keep = i < j
+                i, j = i[keep], j[keep]
+                close = np.sum((pos[order[i]] - pos[order[j]])**2, axis=1) < radius**2
+                pairs_i.append(order[i[close]])
+                pairs_j.append(order[j[close]])
+    return np.concatenate(pairs_i), np.concatenate(pairs_j)
+
+
+def pair_energies(pos, vel, mass, i, j):
+    """Two-body energy of the pairs (i, j), relative motion only"""
+    dr = pos[j] - pos[i]
+    dv = vel[j] - vel[i]
+    mu = mass[i] * mass[j] / (mass[i] + mass[j])
+    r = np.sqrt(np.sum(dr**2, axis=1))
+    return 0.5 * mu * np.sum(dv**2, axis=1) - mass[i] * mass[j] / r
+
+
+def match_pairs(i, j, energy):
+    """
+    Keep each particle in at most one pair: repeatedly accept the pairs
+    that are the most bound pair of both their members
+    Returns the positions of the accepted pairs in i, j
+    """
+    remaining = np.arange(len(i))
+    accepted = []
+    while len(remaining):
+        ii, jj, ee = i[remaining], j[remaining], energy[remaining]
+        n = max(ii.max(), jj.max()) + 1
+        best = np.full(n, np.inf)
+        np.minimum.at(best, ii, ee)
+        np.minimum.at(best, jj, ee)
+        # The most bound remaining pair is always mutual, so this terminates
+        mutual = (ee == best[ii]) & (ee == best[jj])
+        accepted.append(remaining[mutual])
+        used = np.zeros(n, dtype=bool)
+        used[ii[mutual]] = True
+        used[jj[mutual]] = True
+        remaining = remaining[~(used[ii] | used[jj])]
+    return np.concatenate(accepted) if accepted else np.empty(0, dtype=np.int64)
+
+
+def orbital_elements(pos, vel, mass, i, j):
+    """Orbital elements of the bound pairs (i, j) as a BINARY_DTYPE array"""
+    m1, m2 = mass[i], mass[j]
+    m = m1 + m2
+    dr = pos[j] - pos[i]
+    dv = vel[j] - vel[i]
+    r = np.sqrt(np.sum(dr**2, axis=1))
+    specific = 0.5 * np.sum(dv**2, axis=1) - m / r
+    h = np.cross(dr, dv)
+    h_norm = np.sqrt(np.sum(h**2, axis=1))
+
+    a = -m / (2.0 * specific)
+    binaries = np.empty(len(i), dtype=BINARY_DTYPE)
+    binaries['m1'], binaries['m2'] = m1, m2
+    binaries['a'] = a
+    binaries['e'] = np.sqrt(np.maximum(1.0 + 2.0 * specific * h_norm**2 / m**2, 0.0))
+    binaries['period'] = 2.0 * np.pi * np.sqrt(a**3 / m)
+    binaries['inclination'] = np.arccos(np.clip(h[:, 2] / h_norm, -1.0, 1.0))
+    binaries['e_bind'] = m1 * m2 / (2.0 * a)
+    binaries['separation'] = r
+    binaries['cm_pos'] = (m1[:, None] * pos[i] + m2[:, None] * pos[j]) / m[:, None]
+    return binaries
+
+
+def spherical_potential(r, mass):
+    """
+    Potential of a spherical mass distribution at each particle radius:
+    phi(r_i) = -M(<r_i) / r_i - sum_{r_j > r_i} m_j / r_j
+    """
+    order = np.argsort(r)
+    r_s, m_s = r[order], mass[order]
+    inner = np.cumsum(m_s) - m_s
+    outer = np.cumsum((m_s / r_s)[::-1])[::-1] - m_s / r_s
+    phi = np.empty_like(r)
+    with np.errstate(divide='ignore'):
+        phi[order] = -inner / r_s - outer
+    return phi
+
+
+def find_binaries(pos, vel, mass, radius):
+    """Bound pairs within radius of each other, one pair per particle"""
+    i, j = neighbour_pairs(pos, radius)
+    energy = pair_energies(pos, vel, mass, i, j)
+    bound = energy < 0
+    i, j, energy = i[bound], j[bound], energy[bound]
+    keep = match_pairs(i, j, energy)
+    return i[keep], j[keep]
+
+
+def catalogue(ids, pos, vel, mass, r_search=None, r_escape=None):
+    """
+    Binaries and escapers of one snapshot
+    r_search defaults to SEARCH_FACTOR mean interparticle distances
+    inside the half-mass radius, r_escape to ESCAPE_FACTOR * r_half.
+    Returns: binaries (BINARY_DTYPE), escapers (ESCAPER_DTYPE), summary dict
+    """
+    (r_half,), centre = lagrangian_radii(pos, mass, (0.5,))
+    if r_search is None:
+        spacing = (4.0 / 3.0 * np.pi * r_half**3 / (0.5 * len(mass)))**(1.0 / 3.0)
+        r_search = SEARCH_FACTOR * spacing
+    if r_escape is None:
+        r_escape = ESCAPE_FACTOR * r_half
+
+    v = vel - centre_of_mass(vel, mass)
+    i, j = find_binaries(pos, v, mass, r_search)
+    binaries = orbital_elements(pos, v, mass, i, j)
+    binaries['id1'], binaries['id2'] = ids[i], ids[j]
+    binaries = binaries[np.argsort(-binaries['e_bind'])]
+
+    r = np.sqrt(np.sum((pos - centre)**2, axis=1))
+    energy = 0.5 * np.sum(v**2, axis=1) + spherical_potential(r, mass)
+    esc = np.flatnonzero((r > r_escape) & (energy > 0))
+    escapers = np.empty(len(esc), dtype=ESCAPER_DTYPE)
+    escapers['id'], escapers['r'], escapers['energy'] = ids[esc], r[esc], energy[esc]
+
+    # kT = (2/3) of the mean kinetic energy per particle
+    kt = (2.0 / 3.0) * 0.5 * mass @ np.sum(v**2, axis=1) / len(mass)
+    summary = {
+        'n_binaries': len(binaries),
+        'n_hard': int(np.count_nonzero(binaries['e_bind'] > HARD_LIMIT * kt)),
+        'e_bind_total': float(binaries['e_bind'].sum()),
+        'a_min': float(binaries['a'].min()) if len(binaries) else None,
+        'n_escapers': len(escapers),
+        'escaper_mass': float(mass[esc].sum()),
+        'r_search': float(r_search),
+        'r_escape': float(r_escape),
+        'kT': float(kt),
+    }
+    return binaries, escapers, summary
+
+
+def catalogue_path(outputs_dir, filename):
+    name = os.path.splitext(os.path.basename(filename))[0]
+    return os.path.join(outputs_dir, CATALOGUE_DIR, name + '.npz')
+
+
+def snapshot_catalogue(args):
+    """Worker: catalogue of one snapshot, written next to the others"""
+    filename, outputs_dir, r_search, r_escape = args
+    diskstep, nbody, time, particles = read_snapshot(filename)
+    binaries, escapers, summary = catalogue(particles['id'], particles['pos'], particles['vel'],
+                                            particles['mass'], r_search, r_escape)
+    path = catalogue_path(outputs_dir, filename)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    np.savez_compressed(path, binaries=binaries, escapers=escapers, time=time)
+    return filename, time, summary
+
+
+def run_catalogue(outputs_dir='../outputs', r_search=None, r_escape=None, processes=None):
+    """
+    Catalogue every snapshot of a run not yet in the "binaries" table
+    Returns the table rows in time order
+    """
+    files = sorted(glob.glob(os.path.join(outputs_dir, SNAPSHOT_PATTERN)))
+    table = ResultsTable(outputs_dir, 'binaries', version=CATALOGUE_VERSION)
+    pending = [f for f in files
+               if table.get(f) is None or not os.path.exists(catalogue_path(outputs_dir, f))
+               or (r_search, r_escape) != tuple(table.get(f)['values']['options'])]
+    if pending:
+        with Pool(processes) as pool:
+            tasks = [(f, outputs_dir, r_search, r_escape) for f in pending]
+            for filename, time, summary in pool.imap_unordered(snapshot_catalogue, tasks):
+                summary['options'] = [r_search, r_escape]
+                table.put(filename, time, summary)
+                table.save()
+    return table.select(files)
+
+
+def load_catalogue(outputs_dir, filename):
+    """Binaries and escapers stored for a snapshot file"""
+    with np.load(catalogue_path(outputs_dir, filename)) as data:
+        return data['binaries'], data['escapers']
+
+
+def main():
+    """
+    Catalogue binaries and escapers of every snapshot of a run
+    """
+    args = sys.argv[1:]
+    outputs_dir = '../outputs'
+    if args and not args[0].startswith('--'):
+        outputs_dir = args.pop(0)
+    options = dict(zip(args[::2], args[1::2]))
+    r_search = float(options['--r-search']) if '--r-search' in options else None
+    r_escape = float(options['--r-escape']) if '--r-escape' in options else None
+
+    rows = run_catalogue(outputs_dir, r_search, r_escape)
+    print(f"{'t':>9} {'binaries':>9} {'hard':>5} {'a_min':>10} {'E_bind':>10} {'escapers':>9} {'M_esc':>8}")
+    for row in rows:
+        s = row['values']
+        a_min = f"{s['a_min']:10.3e}" if s['a_min'] is not None else f"{'-':>10}"
+        print(f"{row['time']:>9.3f} {s['n_binaries']:>9d} {s['n_hard']:>5d} {a_min} "
+              f"{s['e_bind_total']:>10.3e} {s['n_escapers']:>9d} {s['escaper_mass']:>8.4f}")
+    if rows:
+        print(f"\nCatalogues: {os.path.join(outputs_dir, CATALOGUE_DIR)}/NNNN.npz "
+              f"(r_search={rows[-1]['values']['r_search']:.4g}, "
+              f"r_escape={rows[-1]['values']['r_escape']:.4g})")
+
+
+if __name__ == '__main__':
+    main()
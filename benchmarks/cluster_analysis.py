@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+Cluster Analysis
+Mass-weighted Lagrangian radii around a proper centre, computed with
+O(N) selection instead of a full sort, and swept over every snapshot of
+a run in a process pool
+"""
+
+import sys
+from multiprocessing import Pool
+
+import numpy as np
+
+from run_store import RunStore
+
+DEFAULT_FRACTIONS = (0.01, 0.05, 0.1, 0.25, 0.5, 0.75, 0.9)
+
+# Radial bins used to locate each mass fraction before the exact search
+SELECT_BINS = 512
+
+
+def centre_of_mass(pos, mass):
+    """Mass-weighted mean of pos"""
+    return mass @ pos / mass.sum()
+
+
+def shrinking_sphere_centre(pos, mass, shrink=0.9, n_min=1000, frac_min=0.01):
+    """
+    Shrinking-sphere centre (Power et al. 2003): recompute the centre of
+    mass of the particles inside a sphere that shrinks by `shrink` each
+    step, until it holds fewer than max(n_min, frac_min * N) particles.
+    Each step only touches the particles still inside, so the total
+    cost is a small multiple of N.
+    """
+    centre = centre_of_mass(pos, mass)
+    r2 = np.sum((pos - centre)**2, axis=1)
+    radius = np.sqrt(r2.max())
+    limit = max(n_min, int(frac_min * len(pos)))
+
+    inside = np.arange(len(pos))
+    while True:
+        radius *= shrink
+        keep = r2 < radius**2
+        if np.count_nonzero(keep) < limit:
+            return centre
+        inside = inside[keep]
+        centre = centre_of_mass(pos[inside], mass[inside])
+        r2 = np.sum((pos[inside] - centre)**2, axis=1)
+
+
+def weighted_radii(r, mass, fractions, bins=SELECT_BINS):
+    """
+    Radii enclosing the given fractions of the total mass
+    A log-binned mass histogram (np.bincount, O(N)) locates the bin that
+    holds each fraction; only the particles of that bin are sorted.
+    """
+    fractions = np.asarray(fractions, dtype=np.float64)
+    targets = fractions * mass.sum()
+
+    positive = r[r > 0]
+    if len(positive) and r.max() > positive.min():
+        lo, hi = np.log(positive.min()), np.log(r.max())
+        with np.errstate(divide='ignore'):
+            scaled = (np.log(r) - lo) / (hi - lo) * bins
+        b = np.clip(scaled, 0, bins - 1).astype(np.int64)
+    else:
+        b = np.zeros(len(r), dtype=np.int64)
+
+    bin_mass = np.bincount(b, weights=mass, minlength=bins)
+    cum = np.cumsum(bin_mass)
+
+    radii = np.empty(len(fractions))
+    for k, target in enumerate(targets):
+        kb = min(np.searchsorted(cum, target), bins - 1)
+        # A zero target may land on empty bins below the innermost particle
+        kb += np.flatnonzero(bin_mass[kb:] > 0)[0]
+        below = cum[kb] - bin_mass[kb]
+        members = np.flatnonzero(b == kb)
+        order = np.argsort(r[members])
+        enclosed = below + np.cumsum(mass[members][order])
+        j = min(np.searchsorted(enclosed, target), len(order) - 1)
+        radii[k] = r[members][order[j]]
+    return radii
+
+
+def lagrangian_radii(pos, mass, fractions=DEFAULT_FRACTIONS, centre=None):
+    """
+    Mass-weighted Lagrangian radii
+    centre defaults to the shrinking-sphere centre
+    Returns: radii, centre
+    """
+    if centre is None:
+        centre = shrinking_sphere_centre(pos, mass)
+    r = np.sqrt(np.sum((pos - centre)**2, axis=1))
+    return weighted_radii(r, mass, fractions), centre
+
+
+def _store_snapshot_radii(args):
+    """Worker: Lagrangian radii of one snapshot of a RunStore (opened locally)"""
+    outputs_dir, index, fractions = args
+    store = RunStore(outputs_dir)
+    state = store.states[index]
+    return lagrangian_radii(state[:, 0:3], store.mass, fractions)
+
+
+def run_lagrangian_radii(outputs_dir='../outputs', fractions=DEFAULT_FRACTIONS, processes=None):
+    """
+    Lagrangian radii of every snapshot of a run in one parallel sweep
+    Returns: times (n_snap,), radii (n_snap, n_frac), centres (n_snap, 3)
+    """
+    store = RunStore(outputs_dir)
+    store.sync()
+    tasks = [(outputs_dir, i, tuple(fractions)) for i in range(len(store))]
+    with Pool(processes) as pool:
+        results = pool.map(_store_snapshot_radii, tasks)
+    if not results:
+        return store.times, np.empty((0, len(fractions))), np.empty((0, 3))
+    radii = np.array([r for r, _ in results])
+    centres = np.array([c for _, c in results])
+    return store.times, radii, centres
+
+
+def main():
+    """
+    Print the Lagrangian radii of every snapshot of a run
+    """
+    outputs_dir = sys.argv[1] if len(sys.argv) > 1 else '../outputs'
+    fractions = DEFAULT_FRACTIONS
+    if len(sys.argv) > 2:
+        fractions = tuple(float(f) for f in sys.argv[2].split(','))
+
+    times, radii, centres = run_lagrangian_radii(outputs_dir, fractions)
+    print("t         " + " ".join(f"r_{f * 100:g}%".rjust(10) for f in fractions))
+    for t, row in zip(times, radii):
+        print(f"{t:<9.3f} " + " ".join(f"{x:10.4f}" for x in row))
+
+
+if __name__ == '__main__':
+    main()
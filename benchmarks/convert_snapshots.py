@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Snapshot Converter
+Converts text snapshots (NNNN.dat, data.con, *.inp) to the binary
+columnar .nbs format read by snapshot_io.open_binary
+"""
+
+import glob
+import os
+import sys
+
+from snapshot_io import BINARY_SUFFIX, read_snapshot, write_binary
+
+DEFAULT_PATTERNS = [
+    '../outputs/[0-9][0-9][0-9][0-9].dat',
+    '../outputs/data.con',
+    '../dat/*.inp',
+    '../data.inp',
+    '../data.con',
+]
+
+
+def binary_path(filename):
+    """Path of the .nbs file produced for a text snapshot"""
+    return filename + BINARY_SUFFIX
+
+
+def convert_file(filename, force=False):
+    """
+    Convert one text snapshot; skipped if the .nbs file is newer
+    Returns the output path, or None if it was up to date
+    """
+    out = binary_path(filename)
+    if not force and os.path.exists(out) and os.path.getmtime(out) >= os.path.getmtime(filename):
+        return None
+
+    diskstep, nbody, time, particles = read_snapshot(filename)
+    # Write to a temporary name so readers never see a half-written file
+    tmp = out + '.tmp'
+    write_binary(tmp, diskstep, time, particles)
+    os.replace(tmp, out)
+    return out
+
+
+def convert_all(patterns=DEFAULT_PATTERNS, force=False):
+    """Convert every file matching patterns"""
+    files = sorted({f for p in patterns for f in glob.glob(p)
+                    if not f.endswith(BINARY_SUFFIX)})
+    if not files:
+        print("No snapshot files found")
+        return
+
+    converted = 0
+    text_bytes = 0
+    binary_bytes = 0
+    for filename in files:
+        try:
+            out = convert_file(filename, force=force)
+        except ValueError as e:
+            print(f"Skipping {filename}: {e}")
+            continue
+        if out is None:
+            print(f"Up to date: {filename}")
+            continue
+        converted += 1
+        text_bytes += os.path.getsize(filename)
+        binary_bytes += os.path.getsize(out)
+        print(f"Converted {filename} -> {out}")
+
+    print(f"\nConverted {converted} of {len(files)} files")
+    if converted:
+        print(f"Text: {text_bytes / 1e6:.1f} MB, binary: {binary_bytes / 1e6:.1f} MB")
+
+
+def main():
+    """
+    Main function
+    """
+    args = sys.argv[1:]
+    force = '--force' in args
+    patterns = [a for a in args if a != '--force']
+
+    if patterns in (['-h'], ['--help']):
+        print("Usage: python convert_snapshots.py [--force] [file or glob ...]")
+        print("\nWithout arguments converts:")
+        for p in DEFAULT_PATTERNS:
+            print(f"  {p}")
+        sys.exit(0)
+
+    convert_all(patterns or DEFAULT_PATTERNS, force=force)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,352 @@
+#!/usr/bin/env python3
+"""
+Run Dashboard
+Follows the outputs directory of a running (or rsync'ed) simulation and
+serves a self-refreshing page from a local HTTP server with three
+panels: energy error (contr.dat), Lagrangian radii (snapshots) and
+throughput (steps/s and GFLOPS between consecutive contr.dat lines,
+timed with their real-time column; the integrator order and N are read
+from the header of the engine stdout log).
+The directory is polled, which also works on network and rsync'ed
+directories: each poll parses only the log lines appended since the
+previous one and only the snapshots not seen before, only the panels
+whose data changed are redrawn, and the page reloads only those images.
+"""
+
+import glob
+import io
+import json
+import os
+import re
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+from matplotlib.figure import Figure
+
+from cluster_analysis import DEFAULT_FRACTIONS, lagrangian_radii
+from log_follow import CONTR_COLUMNS, LogFollower
+from results_table import file_identity
+from run_store import SNAPSHOT_PATTERN
+from snapshot_io import read_header, read_snapshot
+
+PANELS = ('energy', 'radii', 'throughput')
+
+# Flops per pair interaction of each integrator order (hermite4/6/8.h)
+FLOPS_BY_ORDER = {4: 60, 6: 97, 8: 144}
+# Used until the log header tells the order (cpu-4th)
+DEFAULT_FLOPS = FLOPS_BY_ORDER[4]
+
+# Header lines of the engine stdout (phi-GPU.cpp)
+ORDER_LINE = re.compile(r'phi-GPU(\d) program')
+NBODY_LINE = re.compile(r'^N\s*=\s*(\d+)', re.MULTILINE)
+# The header is printed before the first energy line
+HEADER_BYTES = 65536
+
+
+def read_log_header(path):
+    """
+    Integrator order and N from the header of an engine stdout log
+    Returns: order, nbody (None where not printed yet)
+    """
+    with open(path, 'r', errors='replace') as f:
+        text = f.read(HEADER_BYTES)
+    order, nbody = ORDER_LINE.search(text), NBODY_LINE.search(text)
+    return (int(order.group(1)) if order else None), (int(nbody.group(1)) if nbody else None)
+
+
+def throughput(time_, timesteps, n_act_sum, real_time, nbody, flops=DEFAULT_FLOPS):
+    """
+    Rates between consecutive energy lines, from the cumulative step and
+    active-particle counters, with the engine's "Real Speed" formula
+    (wall-clock time: user time would sum over every OpenMP thread)
+    Returns: time (interval ends), steps/s, GFLOPS (NaN without nbody)
+    """
+    dt = np.diff(real_time)
+    ok = dt > 0
+    steps = np.diff(timesteps)[ok] / dt[ok]
+    gflops = flops * 1e-9 * (nbody or np.nan) * np.diff(n_act_sum)[ok] / dt[ok]
+    return time_[1:][ok], steps, gflops
+
+
+class RunMonitor:
+    """
+    Incremental state of one outputs directory
+
+    stdout is the engine log (default: the newest *.out in outputs_dir);
+    its header gives the flops per interaction (from the integrator
+    order) and N unless they are passed in. Until it is found, flops
+    defaults to DEFAULT_FLOPS and N comes from the first snapshot.
+    """
+
+    def __init__(self, outputs_dir='../outputs', stdout=None, nbody=None, flops=None,
+                 fractions=DEFAULT_FRACTIONS):
+        self.outputs_dir = outputs_dir
+        self.stdout = stdout
+        self.nbody = nbody
+        self.flops = flops
+        self.order = None
+        self.fractions = tuple(fractions)
+        self.energy = LogFollower(os.path.join(outputs_dir, 'contr.dat'), len(CONTR_COLUMNS))
+        self.log = None
+        self._header_done = False
+        # filename -> (identity, time, radii)
+        self.snapshots = {}
+
+    def _poll_log(self):
+        """
+        Integrator order and N from the stdout log header, once it appears
+        Returns True when they change the throughput
+        """
+        if self._header_done:
+            return False
+        path = self.stdout
+        if path is None:
+            logs = glob.glob(os.path.join(self.outputs_dir, '*.out'))
+            path = max(logs, key=os.path.getmtime) if logs else None
+        if path is None or not os.path.exists(path):
+            return False
+        self.log = path
+        order, nbody = read_log_header(path)
+        if order is None:
+            return False
+        self.order = order
+        if self.flops is None:
+            self.flops = FLOPS_BY_ORDER.get(order, DEFAULT_FLOPS)
+        if self.nbody is None:
+            self.nbody = nbody
+        self._header_done = True
+        return True
+
+    def _poll_snapshots(self):
+        """Lagrangian radii of new or rewritten snapshots"""
+        changed = False
+        for filename in sorted(glob.glob(os.path.join(self.outputs_dir, SNAPSHOT_PATTERN))):
+            identity = file_identity(filename)
+            known = self.snapshots.get(filename)
+            if known is not None and known[0] == identity:
+                continue
+            try:
+                diskstep, nbody, t, particles = read_snapshot(filename, columns=('mass', 'pos'))
+            except ValueError:
+                # Still being written; retried on the next poll
+                continue
+            radii, _ = lagrangian_radii(particles['pos'], particles['mass'], self.fractions)
+            self.snapshots[filename] = (identity, t, radii)
+            changed = True
+        return changed
+
+    def poll(self):
+        """
+        Read whatever was appended or written since the last poll
+        Returns the set of panels whose data changed
+        """
+        changed = set()
+        energy_new = len(self.energy.poll()) > 0 or self.energy.restarted
+        if energy_new:
+            changed.add('energy')
+        if self._poll_log() or energy_new:
+            changed.add('throughput')
+        if self._poll_snapshots():
+            changed.add('radii')
+            if self.nbody is None:
+                self.nbody = read_header(min(self.snapshots))[1]
+                changed.add('throughput')
+        return changed
+
+    def radii_series(self):
+        """Times (n_snap,) and Lagrangian radii (n_snap, n_frac) in time order"""
+        entries = sorted((t, radii) for _, t, radii in self.snapshots.values())
+        if not entries:
+            return np.empty(0), np.empty((0, len(self.fractions)))
+        return np.array([t for t, _ in entries]), np.array([r for _, r in entries])
+
+    def throughput_series(self):
+        """Throughput between contr.dat lines, timed with their real-time column"""
+        data = self.energy.data
+        return throughput(data[:, 0], data[:, 1], data[:, 2], data[:, CONTR_COLUMNS.index('t_real')],
+                          self.nbody, self.flops or DEFAULT_FLOPS)
+
+    def draw(self, panel):
+        """PNG bytes of one panel"""
+        fig = Figure(figsize=(8, 4.5))
+        ax = fig.add_subplot()
+        if panel == 'energy':
+            data = self.energy.data
+            if len(data):
+                e_tot = data[:, CONTR_COLUMNS.index('E_tot')]
+                ax.plot(data[:, 0], (e_tot - e_tot[0]) / abs(e_tot[0]), 'r-', linewidth=1.5)
+            ax.set_ylabel('(E - E0) / |E0|')
+            ax.set_title(f'Energy error ({len(data)} lines)')
+        elif panel == 'radii':
+            times, radii = self.radii_series()
+            for k, f in enumerate(self.fractions):
+                ax.plot(times, radii[:, k], 'o-', markersize=3, label=f'{f * 100:g}%')
+            if len(times):
+                ax.set_yscale('log')
+                ax.legend(fontsize=8, ncol=2)
+            ax.set_ylabel('Lagrangian radius')
+            ax.set_title(f'Lagrangian radii ({len(times)} snapshots)')
+        else:
+            times, steps, gflops = self.throughput_series()
+            ax.plot(times, steps, 'b-', linewidth=1.5)
+            ax.set_ylabel('steps/s', color='b')
+            ax2 = ax.twinx()
+            ax2.plot(times, gflops, 'g-', linewidth=1.5)
+            ax2.set_ylabel('GFLOPS', color='g')
+            latest = f': {steps[-1]:.1f} steps/s, {gflops[-1]:.2f} GFLOPS' if len(times) else ''
+            order = f'order {self.order}' if self.order else 'order unknown'
+            ax.set_title(f'Throughput ({order}, {self.flops or DEFAULT_FLOPS:g} flops/interaction){latest}')
+        ax.set_xlabel('Time (N-body units)')
+        ax.grid(True, alpha=0.3)
+        fig.tight_layout()
+        buffer = io.BytesIO()
+        fig.savefig(buffer, format='png', dpi=100)
+        return buffer.getvalue()
+
+
+PAGE = """<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>N-body run: {outputs_dir}</title>
+<style>body {{ font-family: sans-serif; }} img {{ width: 48%; min-width: 480px; }}</style>
+</head><body>
+<h3>{outputs_dir} <small id="status"></small></h3>
+{images}
+<script>
+const versions = {{}};
+async function refresh() {{
+  try {{
+    const state = await (await fetch('state.json', {{cache: 'no-store'}})).json();
+    for (const [panel, version] of Object.entries(state.versions)) {{
+      if (versions[panel] !== version) {{
+        versions[panel] = version;
+        document.getElementById(panel).src = panel + '.png?v=' + version;
+      }}
+    }}
+    document.getElementById('status').textContent = 'last poll ' + state.polled;
+  }} catch (e) {{
+    document.getElementById('status').textContent = 'monitor not responding';
+  }}
+}}
+refresh();
+setInterval(refresh, {refresh_ms});
+</script>
+</body></html>
+"""
+
+
+class Dashboard:
+    """A RunMonitor polled in a background thread, with its panels cached as PNG"""
+
+    def __init__(self, monitor, interval=5.0):
+        self.monitor = monitor
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.images = {}
+        self.versions = {panel: 0 for panel in PANELS}
+        self.polled = '-'
+
+    def update(self):
+        """One poll; redraws only the changed panels"""
+        changed = self.monitor.poll()
+        images = {panel: self.monitor.draw(panel) for panel in PANELS
+                  if panel in changed or panel not in self.images}
+        with self.lock:
+            self.images.update(images)
+            for panel in images:
+                self.versions[panel] += 1
+            self.polled = time.strftime('%H:%M:%S')
+        return changed
+
+    def run(self):
+        while True:
+            try:
+                changed = self.update()
+                if changed:
+                    print(f"[{self.polled}] updated: {', '.join(sorted(changed))}")
+            except Exception as e:
+                print(f"Poll failed: {e}")
+            time.sleep(self.interval)
+
+    def page(self):
+        images = '\n'.join(f'<img id="{panel}" alt="{panel}">' for panel in PANELS)
+        return PAGE.format(outputs_dir=self.monitor.outputs_dir, images=images,
+                           refresh_ms=int(self.interval * 1000))
+
+    def handler(self):
+        dashboard = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                path = self.path.split('?')[0].lstrip('/')
+                with dashboard.lock:
+                    if path in ('', 'index.html'):
+                        body, content_type = dashboard.page().encode(), 'text/html; charset=utf-8'
+                    elif path == 'state.json':
+                        state = {'versions': dashboard.versions, 'polled': dashboard.polled}
+                        body, content_type = json.dumps(state).encode(), 'application/json'
+                    elif path.endswith('.png') and path[:-4] in dashboard.images:
+                        body, content_type = dashboard.images[path[:-4]], 'image/png'
+                    else:
+                        self.send_error(404)
+                        return
+                self.send_response(200)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.send_header('Cache-Control', 'no-store')
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def serve(self, port=8000, host='127.0.0.1'):
+        self.update()
+        threading.Thread(target=self.run, daemon=True).start()
+        server = ThreadingHTTPServer((host, port), self.handler())
+        print(f"Dashboard for {self.monitor.outputs_dir} on http://{host}:{port}/, Ctrl-C to stop")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+
+
+def main():
+    """
+    Serve the live dashboard of an outputs directory
+    """
+    args = sys.argv[1:]
+    if args and args[0] in ('-h', '--help'):
+        print("Usage: python dashboard.py [outputs_dir] [options]")
+        print("\nOptions:")
+        print("  --port P          (default 8000)")
+        print("  --interval S      seconds between polls (default 5)")
+        print("  --stdout FILE     engine log (default: newest *.out in outputs_dir)")
+        print("  --nbody N         (default: from the log header or the first snapshot)")
+        print("  --flops F         flops per interaction (default: from the integrator order")
+        print("                    in the log header: 60 for cpu-4th, 97 for 6th, 144 for 8th;")
+        print(f"                    {DEFAULT_FLOPS} until the header is found)")
+        sys.exit(1)
+
+    outputs_dir, options = '../outputs', {}
+    rest = iter(args)
+    for arg in rest:
+        if arg.startswith('--'):
+            options[arg] = next(rest)
+        else:
+            outputs_dir = arg
+
+    monitor = RunMonitor(outputs_dir, stdout=options.get('--stdout'),
+                         nbody=int(options['--nbody']) if '--nbody' in options else None,
+                         flops=float(options['--flops']) if '--flops' in options else None)
+    dashboard = Dashboard(monitor, interval=float(options.get('--interval', 5.0)))
+    dashboard.serve(port=int(options.get('--port', 8000)))
+
+
+if __name__ == '__main__':
+    main()
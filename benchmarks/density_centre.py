@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+Density Centre
+Casertano & Hut (1985) density centre, core radius and central density
+from k-nearest-neighbour local densities, using a KD-tree (O(N log N))
+"""
+
+import sys
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+from snapshot_io import read_snapshot
+
+# Casertano & Hut use the 6th nearest neighbour
+DEFAULT_K = 6
+
+
+def local_densities(pos, mass, k=DEFAULT_K, tree=None):
+    """
+    Local density around every particle: mass of the k-1 nearest
+    neighbours inside the sphere that reaches the k-th one
+    """
+    if tree is None:
+        tree = cKDTree(pos)
+    # k + 1 because the nearest neighbour of each particle is itself
+    dist, idx = tree.query(pos, k=k + 1, workers=-1)
+    r_k = dist[:, k]
+    m_inside = mass[idx[:, 1:k]].sum(axis=1)
+    volume = (4.0 / 3.0) * np.pi * r_k**3
+    with np.errstate(divide='ignore'):
+        return np.where(volume > 0, m_inside / volume, np.inf)
+
+
+def density_centre(pos, mass, k=DEFAULT_K, tree=None):
+    """
+    Density-weighted centre, core radius and central density
+    Returns: centre (3,), r_core, rho_core
+    """
+    rho = local_densities(pos, mass, k=k, tree=tree)
+    # Coincident particles give infinite densities; leave them out
+    rho = np.where(np.isfinite(rho), rho, 0.0)
+
+    centre = rho @ pos / rho.sum()
+    r2 = np.sum((pos - centre)**2, axis=1)
+    rho2 = rho**2
+    r_core = np.sqrt(rho2 @ r2 / rho2.sum())
+    rho_core = rho2.sum() / rho.sum()
+    return centre, r_core, rho_core
+
+
+def main():
+    """
+    Print the density centre and core radius of snapshot files
+    """
+    if len(sys.argv) < 2:
+        print("Usage: python density_centre.py <snapshot> [snapshot ...]")
+        sys.exit(1)
+
+    for filename in sys.argv[1:]:
+        diskstep, nbody, time, particles = read_snapshot(filename, columns=('mass', 'pos'))
+        centre, r_core, rho_core = density_centre(particles['pos'], particles['mass'])
+        print(f"{filename}: t={time:.3f}  centre=({centre[0]: .4f}, {centre[1]: .4f}, {centre[2]: .4f})  "
+              f"r_core={r_core:.4f}  rho_core={rho_core:.4e}")
+
+
+if __name__ == '__main__':
+    main()
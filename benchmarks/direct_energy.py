@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""
+Direct-Sum Energy
+Recomputes E_pot / E_kin of a snapshot with the engine's softened
+potential, pot_i = -sum_{j != i} m_j / sqrt(r_ij^2 + eps^2), so it can
+be checked against contr.dat. Pairs are evaluated in block x block
+tiles (memory bounded by the block size) and the rows of tiles are
+spread over a process pool that shares the particle arrays.
+"""
+
+import sys
+from multiprocessing import Pool, shared_memory
+
+import numpy as np
+
+from log_follow import CONTR_COLUMNS, LogFollower
+from snapshot_io import read_snapshot
+
+# Each worker holds two block x block float64 temporaries (8 MB each at 1024)
+DEFAULT_BLOCK = 1024
+
+# Arrays of the parent process, attached by each worker at start-up
+_shared = {}
+
+
+def _attach(names, n, eps2):
+    for key, name, shape in (('pos', names[0], (n, 3)), ('mass', names[1], (n,)),
+                             ('phi', names[2], (n,))):
+        shm = shared_memory.SharedMemory(name=name)
+        _shared[key + '_shm'] = shm
+        _shared[key] = np.ndarray(shape, dtype=np.float64, buffer=shm.buf)
+    _shared['eps2'] = eps2
+
+
+def tile_potential(pos_i, pos_j, mass_j, eps2):
+    """Potential at pos_i from the particles at pos_j (zero-distance pairs skipped)"""
+    # In-place updates keep the tile down to two block x block temporaries
+    d = np.subtract.outer(pos_i[:, 0], pos_j[:, 0])
+    r2 = d * d
+    for k in (1, 2):
+        np.subtract.outer(pos_i[:, k], pos_j[:, k], out=d)
+        d *= d
+        r2 += d
+    # Same mask as calc_force in hermite4.h: zero distance means i == j
+    r2[r2 == 0.0] = np.inf
+    r2 += eps2
+    np.sqrt(r2, out=r2)
+    np.divide(1.0, r2, out=r2)
+    return -(r2 @ mass_j)
+
+
+def _row_potential(args):
+    """Worker: potential of particles lo..hi from all particles, tile by tile"""
+    lo, hi, block = args
+    pos, mass, phi, eps2 = _shared['pos'], _shared['mass'], _shared['phi'], _shared['eps2']
+    acc = np.zeros(hi - lo)
+    for jlo in range(0, len(mass), block):
+        jhi = min(jlo + block, len(mass))
+        acc += tile_potential(pos[lo:hi], pos[jlo:jhi], mass[jlo:jhi], eps2)
+    # Rows are disjoint between tasks, so workers write without locking
+    phi[lo:hi] = acc
+
+
+def serial_potential(pos, mass, eps, block=DEFAULT_BLOCK):
+    """
+    Softened potential of every particle in this process, tile by tile
+    (for callers that already run inside a pool worker)
+    """
+    pos = np.asarray(pos, dtype=np.float64)
+    mass = np.asarray(mass, dtype=np.float64)
+    phi = np.zeros(len(mass))
+    for lo in range(0, len(mass), block):
+        for jlo in range(0, len(mass), block):
+            phi[lo:lo + block] += tile_potential(pos[lo:lo + block], pos[jlo:jlo + block],
+                                                 mass[jlo:jlo + block], eps * eps)
+    return phi
+
+
+def potential(pos, mass, eps, block=DEFAULT_BLOCK, processes=None):
+    """Softened potential of every particle, shape (N,)"""
+    n = len(mass)
+    segments = []
+    try:
+        arrays = []
+        for source in (pos, mass, np.zeros(n)):
+            source = np.ascontiguousarray(source, dtype=np.float64)
+            shm = shared_memory.SharedMemory(create=True, size=max(source.nbytes, 1))
+            segments.append(shm)
+            view = np.ndarray(source.shape, dtype=np.float64, buffer=shm.buf)
+            view[...] = source
+            arrays.append(view)
+
+        tasks = [(lo, min(lo + block, n), block) for lo in range(0, n, block)]
+        with Pool(processes, initializer=_attach,
+                  initargs=([s.name for s in segments], n, eps * eps)) as pool:
+            pool.map(_row_potential, tasks)
+        return arrays[2].copy()
+    finally:
+        for shm in segments:
+            shm.close()
+            shm.unlink()
+
+
+def energies(pos, vel, mass, eps, block=DEFAULT_BLOCK, processes=None):
+    """
+    Potential and kinetic energy as computed by energy() in phi-GPU.cpp
+    Returns: E_pot, E_kin
+    """
+    phi = potential(pos, mass, eps, block=block, processes=processes)
+    e_pot = 0.5 * mass @ phi
+    e_kin = 0.5 * mass @ np.sum(vel**2, axis=1)
+    return e_pot, e_kin
+
+
+def read_eps(config_file):
+    """Softening eps: first value of a phi-GPU config file"""
+    with open(config_file, 'r') as f:
+        return float(f.read().split()[0])
+
+
+def main():
+    """
+    Recompute the energy of a snapshot and compare with contr.dat
+    """
+    args = sys.argv[1:]
+    if not args:
+        print("Usage: python direct_energy.py <snapshot> [options]")
+        print("\nOptions:")
+        print("  --eps E         Softening (default 1.0E-04)")
+        print("  --config FILE   Read eps from a phi-GPU config file")
+        print("  --contr FILE    Energy log to compare with (default ../outputs/contr.dat)")
+        print("  --block B       Tile size (default 1024)")
+        print("  --workers P     Worker processes (default: all cores)")
+        sys.exit(1)
+
+    filename = args[0]
+    options = dict(zip(args[1::2], args[2::2]))
+    eps = read_eps(options['--config']) if '--config' in options else float(options.get('--eps', 1.0e-4))
+
+    diskstep, nbody, time, particles = read_snapshot(filename)
+    e_pot, e_kin = energies(particles['pos'], particles['vel'], particles['mass'], eps,
+                            block=int(options.get('--block', DEFAULT_BLOCK)),
+                            processes=int(options['--workers']) if '--workers' in options else None)
+
+    print(f"{filename}: N={nbody}, t={time:.6f}, eps={eps:.3E}")
+    print(f"  E_pot = {e_pot: .10E}")
+    print(f"  E_kin = {e_kin: .10E}")
+    print(f"  E_tot = {e_pot + e_kin: .10E}")
+
+    follower = LogFollower(options.get('--contr', '../outputs/contr.dat'), len(CONTR_COLUMNS))
+    follower.poll()
+    contr = follower.data
+    if not len(contr):
+        return
+    row = contr[np.argmin(np.abs(contr[:, 0] - time))]
+    if abs(row[0] - time) > 1e-6 * max(1.0, abs(time)):
+        print(f"  contr.dat has no line at t={time} (closest t={row[0]})")
+        return
+    print(f"  contr.dat at t={row[0]:.6f}:")
+    for name, mine, theirs in (('E_pot', e_pot, row[3]), ('E_kin', e_kin, row[4]),
+                               ('E_tot', e_pot + e_kin, row[5])):
+        print(f"    {name} = {theirs: .10E}   rel. diff = {(mine - theirs) / abs(theirs): .3E}")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,76 +1,139 @@
 import numpy as np
 import sys
 
-def generate_plummer(n_particles, seed=42):
+from snapshot_io import BinaryWriter
+
+# Row layout read by phi-GPU.cpp: inp >> id >> mass >> pos >> vel
+ROW_FORMAT = "%d %.8E %.8E %.8E %.8E %.8E %.8E %.8E\n"
+CHUNK_SIZE = 65536
+
+# Max of g(q) = q^2 (1 - q^2)^3.5 is approx 0.0922 (q = sqrt(2/9)),
+# so 0.1 is a safe rejection envelope; about 43% of the draws are accepted
+G_ENVELOPE = 0.1
+ACCEPT_RATE = 0.40
+
+def sample_q(rng, n):
     """
-    Generates a Plummer sphere model.
+    Batched rejection sampling of q = v / v_esc from g(q) = q^2 (1 - q^2)^3.5
+    Draws candidate arrays, keeps the accepted ones and refills only the shortfall.
+    """
+    q = np.empty(n)
+    filled = 0
+    while filled < n:
+        need = n - filled
+        m = int(need / ACCEPT_RATE) + 64
+        qi = rng.random(m)
+        fi = qi**2 * (1.0 - qi**2)**3.5
+        accepted = qi[rng.random(m) * G_ENVELOPE < fi][:need]
+        q[filled:filled + len(accepted)] = accepted
+        filled += len(accepted)
+    return q
+
+def plummer_chunk(rng, n_particles):
+    """
+    Positions and velocities of n_particles drawn from a Plummer sphere.
     Based on Aarseth et al. (1974) recipe.
     """
-    np.random.seed(seed)
-    
-    # Mass of each particle (total mass = 1)
-    mass = 1.0 / n_particles
-    
     # Radii
-    X1 = np.random.random(n_particles)
+    X1 = rng.random(n_particles)
     r = (X1**(-2.0/3.0) - 1.0)**(-0.5)
-    
+
     # Positions
-    X2 = np.random.random(n_particles)
-    X3 = np.random.random(n_particles)
+    X2 = rng.random(n_particles)
+    X3 = rng.random(n_particles)
     z = (1.0 - 2.0*X2) * r
     x = (r**2 - z**2)**0.5 * np.cos(2.0*np.pi*X3)
     y = (r**2 - z**2)**0.5 * np.sin(2.0*np.pi*X3)
-    
+
     # Velocities
     # Escape velocity at r: v_esc = sqrt(2 * phi(r)) = sqrt(2) * (1 + r^2)^(-1/4)
     # q = v / v_esc
     # Distribution of q: g(q) = q^2 * (1 - q^2)^(3.5)
-    
-    X4 = np.random.random(n_particles)
-    X5 = np.random.random(n_particles)
-    
-    # Rejection sampling for velocity magnitude
-    # Max of g(q) is at q = sqrt(2/9) approx 0.47
-    # We can use a simple rejection method
-    
-    q = np.zeros(n_particles)
-    for i in range(n_particles):
-        while True:
-            qi = np.random.random()
-            fi = qi**2 * (1.0 - qi**2)**3.5
-            # Max value of f(q) is approx 0.1
-            if np.random.random() * 0.1 < fi:
-                q[i] = qi
-                break
-                
+    q = sample_q(rng, n_particles)
+
     v_esc = np.sqrt(2.0) * (1.0 + r**2)**(-0.25)
     v = q * v_esc
-    
-    X6 = np.random.random(n_particles)
-    X7 = np.random.random(n_particles)
-    
+
+    X6 = rng.random(n_particles)
+    X7 = rng.random(n_particles)
+
     vz = (1.0 - 2.0*X6) * v
     vx = (v**2 - vz**2)**0.5 * np.cos(2.0*np.pi*X7)
     vy = (v**2 - vz**2)**0.5 * np.sin(2.0*np.pi*X7)
-    
+
+    return x, y, z, vx, vy, vz
+
+def generate_plummer_chunks(n_particles, seed=42, chunk_size=CHUNK_SIZE):
+    """
+    Yields (start, x, y, z, vx, vy, vz) for consecutive chunks of a
+    Plummer sphere, so memory stays bounded by chunk_size.
+    Deterministic for a given (seed, chunk_size).
+    """
+    rng = np.random.default_rng(seed)
+    for start in range(0, n_particles, chunk_size):
+        n = min(chunk_size, n_particles - start)
+        yield (start,) + plummer_chunk(rng, n)
+
+def generate_plummer(n_particles, seed=42):
+    """
+    Generates a Plummer sphere model.
+    Returns: mass, x, y, z, vx, vy, vz (total mass = 1)
+    """
+    # Mass of each particle (total mass = 1)
+    mass = 1.0 / n_particles
+
+    chunks = [c[1:] for c in generate_plummer_chunks(n_particles, seed)]
+    x, y, z, vx, vy, vz = (np.concatenate(col) for col in zip(*chunks))
     return mass, x, y, z, vx, vy, vz
 
-def write_input_file(filename, n_particles):
-    mass, x, y, z, vx, vy, vz = generate_plummer(n_particles)
-    
+
+def write_rows(f, start, mass, x, y, z, vx, vy, vz, chunk_size=CHUNK_SIZE):
+    """
+    Write particle rows in fixed-size chunks
+    Each chunk is formatted with a single % operation, so the per-row
+    cost stays in C and memory is bounded by chunk_size.
+    """
+    n = len(x)
+    for lo in range(0, n, chunk_size):
+        hi = min(lo + chunk_size, n)
+        block = np.empty((hi - lo, 8))
+        block[:, 0] = np.arange(start + lo, start + hi)
+        block[:, 1] = mass
+        block[:, 2] = x[lo:hi]
+        block[:, 3] = y[lo:hi]
+        block[:, 4] = z[lo:hi]
+        block[:, 5] = vx[lo:hi]
+        block[:, 6] = vy[lo:hi]
+        block[:, 7] = vz[lo:hi]
+        f.write((ROW_FORMAT * (hi - lo)) % tuple(block.ravel().tolist()))
+
+def write_input_file(filename, n_particles, binary=False, seed=42):
+    # Mass of each particle (total mass = 1)
+    mass = 1.0 / n_particles
+    chunks = generate_plummer_chunks(n_particles, seed)
+
+    if binary:
+        # Binary columnar .nbs snapshot (see snapshot_io.py)
+        with BinaryWriter(filename, 0, n_particles, 0.0) as writer:
+            for start, x, y, z, vx, vy, vz in chunks:
+                writer.write_rows(start, {
+                    'id': np.arange(start, start + len(x)), 'mass': np.full(len(x), mass),
+                    'x': x, 'y': y, 'z': z, 'vx': vx, 'vy': vy, 'vz': vz})
+        return
+
     with open(filename, 'w') as f:
         # Header: diskstep, nbody, time
         f.write(f"0\n{n_particles}\n0.0\n")
-        
-        for i in range(n_particles):
-            # Format: id mass x y z vx vy vz
-            # Using scientific notation for precision
-            f.write(f"{i} {mass:.8E} {x[i]:.8E} {y[i]:.8E} {z[i]:.8E} {vx[i]:.8E} {vy[i]:.8E} {vz[i]:.8E}\n")
+        # Format: id mass x y z vx vy vz
+        # Using scientific notation for precision
+        for start, x, y, z, vx, vy, vz in chunks:
+            write_rows(f, start, mass, x, y, z, vx, vy, vz)
 
 if __name__ == "__main__":
-    N = 25600
-    FILENAME = "../data_m15.inp"
+    args = [a for a in sys.argv[1:] if a != '--binary']
+    BINARY = '--binary' in sys.argv[1:]
+    N = int(args[0]) if args else 25600
+    FILENAME = args[1] if len(args) > 1 else "../data_m15.inp"
     print(f"Generating Plummer sphere with N={N} particles...")
-    write_input_file(FILENAME, N)
+    write_input_file(FILENAME, N, binary=BINARY)
     print(f"File {FILENAME} created successfully.")
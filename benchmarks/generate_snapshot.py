@@ -3,15 +3,7 @@ from mpl_toolkits.mplot3d import Axes3D
 import numpy as np
 import glob
 
-def read_dat_file(filename):
-    with open(filename, 'r') as f:
-        lines = f.readlines()
-        data = []
-        for line in lines[3:]:
-            parts = line.split()
-            if len(parts) >= 8:
-                data.append([float(x) for x in parts[2:8]])
-    return np.array(data)
+from snapshot_io import read_snapshot
 
 def generate_snapshot():
     files = sorted(glob.glob("../outputs/0*.dat"))
@@ -19,16 +11,17 @@ def generate_snapshot():
     
     # Use the last file for the snapshot
     last_file = files[-1]
-    data = read_dat_file(last_file)
+    _, _, _, data = read_snapshot(last_file, columns=('pos', 'vel'))
     
     fig = plt.figure(figsize=(10, 10), facecolor='black')
     ax = fig.add_subplot(111, projection='3d', facecolor='black')
     ax.set_axis_off()
     
-    vel = np.linalg.norm(data[:, 3:], axis=1)
+    vel = np.linalg.norm(data['vel'], axis=1)
     norm = plt.Normalize(vel.min(), vel.max())
     
-    ax.scatter(data[:, 0], data[:, 1], data[:, 2], 
+    pos = data['pos']
+    ax.scatter(pos[:, 0], pos[:, 1], pos[:, 2], 
                c=vel, cmap='plasma', s=1.0, alpha=0.9, norm=norm)
                
     # Zoom out slightly to see structure
@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""
+Initial Conditions Cache
+Generated input files stored under a hash of (model, N, seed, params,
+generator version), so benchmark reruns reuse identical inputs.
+Each entry keeps the SHA-256 of its content, checked on every hit, and
+is copied (not linked) to the run directory so runs cannot modify it.
+Least recently used entries are evicted beyond a size budget.
+
+Environment:
+  NBODY_IC_CACHE_DIR  cache directory (default ~/.cache/nbody-ics)
+  NBODY_IC_CACHE_MB   size budget in MB (default 4096)
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import sys
+
+from initial_conditions import GENERATOR_VERSION, write_model
+
+CACHE_DIR = os.environ.get('NBODY_IC_CACHE_DIR',
+                           os.path.join(os.path.expanduser('~'), '.cache', 'nbody-ics'))
+CACHE_BYTES = int(float(os.environ.get('NBODY_IC_CACHE_MB', 4096)) * 1024 * 1024)
+
+CHUNK_BYTES = 1 << 20
+
+
+def ic_key(model, n_particles, seed, binary=False, **params):
+    """Hash identifying the generated file"""
+    ident = json.dumps({'model': model, 'n': n_particles, 'seed': seed, 'binary': binary,
+                        'params': params, 'version': GENERATOR_VERSION}, sort_keys=True)
+    return hashlib.sha1(ident.encode()).hexdigest()
+
+
+def cached_path(key, binary=False):
+    return os.path.join(CACHE_DIR, key + ('.nbs' if binary else '.inp'))
+
+
+def digest_path(path):
+    """Sidecar file holding the SHA-256 of a cached file"""
+    return path + '.sha256'
+
+
+def file_digest(path):
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_BYTES), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def stored_digest(path):
+    """Recorded SHA-256 of a cached file, or None if the entry is incomplete"""
+    try:
+        with open(digest_path(path), 'r') as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+def get_or_generate(model, n_particles, output_path, seed=42, binary=False, **params):
+    """
+    Place the requested model at output_path, generating it only on a cache miss
+    Returns True if the cache already held it.
+    """
+    key = ic_key(model, n_particles, seed, binary=binary, **params)
+    path = cached_path(key, binary)
+    digest = stored_digest(path) if os.path.exists(path) else None
+    hit = digest is not None and file_digest(path) == digest
+    if digest is not None and not hit:
+        print(f"Cached initial conditions {os.path.basename(path)} are corrupted; regenerating")
+
+    if not hit:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        tmp = path + '.tmp'
+        write_model(tmp, n_particles, model=model, seed=seed, binary=binary, **params)
+        digest = file_digest(tmp)
+        os.replace(tmp, path)
+        # The digest is written last: an entry only counts once it exists
+        with open(digest_path(path) + '.tmp', 'w') as f:
+            f.write(digest + '\n')
+        os.replace(digest_path(path) + '.tmp', digest_path(path))
+    else:
+        # Refresh the access time used for LRU eviction
+        os.utime(path)
+
+    copy_out(path, output_path)
+    evict(keep=path)
+    return hit
+
+
+def copy_out(path, output_path):
+    """
+    Copy a cached file to output_path
+    A copy, not a hard link: the run may rewrite its input in place,
+    which must not reach the cache. An existing output_path (possibly
+    a hard link left by older versions) is replaced, not written through.
+    """
+    if os.path.lexists(output_path):
+        os.remove(output_path)
+    out_dir = os.path.dirname(output_path)
+    if out_dir:
+        os.makedirs(out_dir, exist_ok=True)
+    shutil.copyfile(path, output_path)
+
+
+def entries():
+    """(access time, bytes, path) of every cached file, oldest first"""
+    if not os.path.isdir(CACHE_DIR):
+        return []
+    result = []
+    for name in os.listdir(CACHE_DIR):
+        if not name.endswith(('.inp', '.nbs')):
+            continue
+        path = os.path.join(CACHE_DIR, name)
+        try:
+            result.append((os.path.getmtime(path), os.path.getsize(path), path))
+        except OSError:
+            continue
+    return sorted(result)
+
+
+def evict(budget=None, keep=None):
+    """Remove least recently used files until the cache fits the budget"""
+    budget = CACHE_BYTES if budget is None else budget
+    current = entries()
+    total = sum(size for _, size, _ in current)
+    for _, size, path in current:
+        if total <= budget:
+            break
+        if path == keep:
+            continue
+        for name in (path, digest_path(path)):
+            try:
+                os.remove(name)
+            except OSError:
+                pass
+        total -= size
+
+
+def main():
+    """
+    Show or clear the initial conditions cache
+    """
+    command = sys.argv[1] if len(sys.argv) > 1 else 'info'
+    if command == 'clear':
+        evict(budget=0)
+        print(f"Cleared {CACHE_DIR}")
+    elif command == 'info':
+        current = entries()
+        total = sum(size for _, size, _ in current)
+        print(f"Cache: {CACHE_DIR}")
+        print(f"Entries: {len(current)}, {total / 1e6:.1f} MB of {CACHE_BYTES / 1e6:.0f} MB")
+    else:
+        print("Usage: python ic_cache.py [info|clear]")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
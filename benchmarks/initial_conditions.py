@@ -0,0 +1,342 @@
+#!/usr/bin/env python3
+"""
+Initial Conditions Generator
+Plummer, Hernquist and King models with an optional multi-mass IMF,
+generated in parallel and reproducibly: N is split into fixed blocks,
+each with its own SeedSequence child stream, so the output does not
+depend on the number of worker processes.
+
+Units: G = 1, total mass = 1 (Plummer/Hernquist scale radius a = 1,
+King core radius r0 = 1).
+"""
+
+import io
+import math
+import sys
+from functools import lru_cache
+from multiprocessing import Pool
+
+import numpy as np
+
+from generate_plummer import plummer_chunk, write_rows
+from snapshot_io import BinaryWriter
+
+# Bump when the sampling changes: generated files are no longer identical
+GENERATOR_VERSION = 1
+
+# Particles per SeedSequence child; fixed so results are worker-independent
+BLOCK_SIZE = 65536
+
+# Velocity grid used to bound the speed distribution for rejection sampling
+ENVELOPE_POINTS = 64
+ENVELOPE_MARGIN = 1.1
+
+
+def sample_speeds(rng, v_max, density):
+    """
+    Batched rejection sampling of speeds in [0, v_max] with
+    p(v) proportional to density(v, i) for particle i.
+    The envelope is the per-particle maximum over a velocity grid.
+    """
+    n = len(v_max)
+    u = np.linspace(0.0, 1.0, ENVELOPE_POINTS + 1)[1:-1]
+    grid = v_max[:, None] * u[None, :]
+    bound = density(grid, np.arange(n)[:, None]).max(axis=1) * ENVELOPE_MARGIN
+
+    v = np.empty(n)
+    todo = np.arange(n)
+    while len(todo):
+        vi = rng.random(len(todo)) * v_max[todo]
+        accept = rng.random(len(todo)) * bound[todo] < density(vi, todo)
+        v[todo[accept]] = vi[accept]
+        todo = todo[~accept]
+    return v
+
+
+def isotropic(rng, magnitude):
+    """Random isotropic vectors with the given lengths, shape (n, 3)"""
+    n = len(magnitude)
+    cos_t = 1.0 - 2.0 * rng.random(n)
+    sin_t = np.sqrt(1.0 - cos_t**2)
+    phi = 2.0 * np.pi * rng.random(n)
+    return magnitude[:, None] * np.column_stack(
+        [sin_t * np.cos(phi), sin_t * np.sin(phi), cos_t])
+
+
+def plummer_block(rng, n):
+    """Plummer sphere (Aarseth et al. 1974), see generate_plummer.py"""
+    x, y, z, vx, vy, vz = plummer_chunk(rng, n)
+    return np.column_stack([x, y, z]), np.column_stack([vx, vy, vz])
+
+
+def hernquist_df(eps):
+    """Isotropic Hernquist (1990) distribution function, G = M = a = 1"""
+    q = np.sqrt(np.clip(eps, 0.0, 1.0 - 1e-12))
+    f = (3.0 * np.arcsin(q) + q * np.sqrt(1.0 - q**2) * (1.0 - 2.0 * q**2)
+         * (8.0 * q**4 - 8.0 * q**2 - 3.0)) / (1.0 - q**2)**2.5
+    return f / (8.0 * np.sqrt(2.0) * np.pi**3)
+
+
+def hernquist_block(rng, n, r_max=100.0):
+    """Hernquist sphere truncated at r_max, M(r) = r^2 / (1 + r)^2"""
+    # Invert the cumulative mass, restricted to the mass inside r_max
+    x_max = r_max / (1.0 + r_max)
+    s = np.sqrt(rng.random(n)) * x_max
+    r = s / (1.0 - s)
+
+    psi = 1.0 / (1.0 + r)
+    v_esc = np.sqrt(2.0 * psi)
+    v = sample_speeds(rng, v_esc,
+                      lambda v, i: v**2 * hernquist_df(psi[i] - 0.5 * v**2))
+    return isotropic(rng, r), isotropic(rng, v)
+
+
+def king_density(w):
+    """King (1966) density for potential depth W, in units of sigma = 1"""
+    w = max(w, 0.0)
+    return math.exp(w) * math.erf(math.sqrt(w)) - math.sqrt(4.0 * w / math.pi) * (1.0 + 2.0 * w / 3.0)
+
+
+@lru_cache(maxsize=None)
+def king_profile(w0, steps=20000):
+    """
+    Solve Poisson's equation for a King model of central depth w0
+    Returns r, W(r), M(r) tabulated out to the tidal radius, with
+    r in core radii, sigma = 1 and G = 1.
+    """
+    rho0 = king_density(w0)
+
+    # y = (W, r^2 dW/dr) integrated with RK4 in s = ln r
+    def deriv(s, y):
+        r = math.exp(s)
+        return np.array([y[1] / r, -9.0 * r**3 * king_density(y[0]) / rho0])
+
+    r_min, r_max = 1e-4, 1e4
+    h = np.log(r_max / r_min) / steps
+    s = np.log(r_min)
+    y = np.array([w0 - 1.5 * r_min**2, -3.0 * r_min**3])
+    rs, ws, ms = [0.0], [w0], [0.0]
+    for _ in range(steps):
+        k1 = deriv(s, y)
+        k2 = deriv(s + h / 2, y + h / 2 * k1)
+        k3 = deriv(s + h / 2, y + h / 2 * k2)
+        k4 = deriv(s + h, y + h * k3)
+        y_new = y + h / 6 * (k1 + 2 * k2 + 2 * k3 + k4)
+        if y_new[0] <= 0.0:
+            # Tidal radius: interpolate W = 0 inside the last step
+            frac = y[0] / (y[0] - y_new[0])
+            rs.append(np.exp(s + frac * h))
+            ws.append(0.0)
+            ms.append(-(y[1] + frac * (y_new[1] - y[1])))
+            break
+        s += h
+        y = y_new
+        rs.append(np.exp(s))
+        ws.append(y[0])
+        ms.append(-y[1])
+    return np.array(rs), np.array(ws), np.array(ms)
+
+
+def king_block(rng, n, w0=6.0):
+    """King model with central potential depth w0, scaled to M = 1"""
+    r_tab, w_tab, m_tab = king_profile(float(w0))
+    m_total = m_tab[-1]
+
+    r = np.interp(rng.random(n) * m_total, m_tab, r_tab)
+    w = np.interp(r, r_tab, w_tab)
+    v = sample_speeds(rng, np.sqrt(2.0 * w),
+                      lambda v, i: v**2 * np.maximum(np.exp(w[i] - 0.5 * v**2) - 1.0, 0.0))
+
+    # With G = sigma = r0 = 1 the model mass is m_total; rescale velocities
+    # so that the same positions hold a unit mass in equilibrium
+    return isotropic(rng, r), isotropic(rng, v / np.sqrt(m_total))
+
+
+MODELS = {
+    'plummer': plummer_block,
+    'hernquist': hernquist_block,
+    'king': king_block,
+}
+
+# Piecewise power-law IMFs: (mass breaks, slopes alpha of dN/dm ~ m^-alpha)
+IMFS = {
+    'salpeter': ([0.1, 100.0], [2.35]),
+    'kroupa': ([0.08, 0.5, 100.0], [1.3, 2.3]),
+}
+
+
+def sample_imf(rng, n, imf):
+    """Stellar masses (solar units) from a piecewise power-law IMF"""
+    breaks, slopes = IMFS[imf]
+    breaks = np.asarray(breaks)
+
+    # Weight of each segment, continuous at the breaks
+    weights = []
+    scale = 1.0
+    for k, alpha in enumerate(slopes):
+        lo, hi = breaks[k], breaks[k + 1]
+        if k > 0:
+            scale *= lo**(slopes[k] - slopes[k - 1])
+        weights.append(scale * segment_integral(lo, hi, alpha))
+    weights = np.array(weights) / np.sum(weights)
+
+    segment = rng.choice(len(slopes), size=n, p=weights)
+    u = rng.random(n)
+    lo = breaks[segment]
+    hi = breaks[segment + 1]
+    a = 1.0 - np.asarray(slopes)[segment]
+    # Inverse CDF of m^-alpha on [lo, hi]
+    return (lo**a + u * (hi**a - lo**a))**(1.0 / a)
+
+
+def segment_integral(lo, hi, alpha):
+    a = 1.0 - alpha
+    return (hi**a - lo**a) / a
+
+
+def block_seeds(n_particles, seed):
+    """Independent SeedSequence child for every block of BLOCK_SIZE particles"""
+    n_blocks = (n_particles + BLOCK_SIZE - 1) // BLOCK_SIZE
+    return np.random.SeedSequence(seed).spawn(n_blocks)
+
+
+def generate_block(task):
+    """
+    Generate one block
+    Returns start, mass, pos, vel (mass unnormalized when an IMF is used)
+    """
+    start, n, seed_seq, model, params, imf = task
+    rng = np.random.default_rng(seed_seq)
+    pos, vel = MODELS[model](rng, n, **params)
+    mass = sample_imf(rng, n, imf) if imf else np.ones(n)
+    return start, mass, pos, vel
+
+
+def block_moments(task):
+    """Mass, mass-weighted position and velocity sums of one block"""
+    start, mass, pos, vel = generate_block(task)
+    return mass.sum(), mass @ pos, mass @ vel
+
+
+def corrected_block(task, m_total, xcm, vcm):
+    """Block with masses normalized to total 1 and the centre of mass at rest at 0"""
+    start, mass, pos, vel = generate_block(task)
+    return start, mass / m_total, pos - xcm, vel - vcm
+
+
+def format_block(args):
+    """Corrected block formatted as input-file rows (done in the worker)"""
+    start, mass, pos, vel = corrected_block(*args)
+    out = io.StringIO()
+    write_rows(out, start, mass, pos[:, 0], pos[:, 1], pos[:, 2],
+               vel[:, 0], vel[:, 1], vel[:, 2])
+    return out.getvalue()
+
+
+def block_tasks(n_particles, model='plummer', seed=42, imf=None, **params):
+    if model not in MODELS:
+        raise ValueError(f"Unknown model '{model}' (available: {', '.join(MODELS)})")
+    if imf is not None and imf not in IMFS:
+        raise ValueError(f"Unknown IMF '{imf}' (available: {', '.join(IMFS)})")
+    seeds = block_seeds(n_particles, seed)
+    return [(k * BLOCK_SIZE, min(BLOCK_SIZE, n_particles - k * BLOCK_SIZE), s, model, params, imf)
+            for k, s in enumerate(seeds)]
+
+
+def centre_of_mass(pool, tasks):
+    """
+    First pass: total mass and centre of mass position/velocity,
+    like the CMCORR block in phi-GPU.cpp. Only the sums leave the workers.
+    """
+    moments = pool.map(block_moments, tasks)
+    m_total = sum(m for m, _, _ in moments)
+    xcm = sum(x for _, x, _ in moments) / m_total
+    vcm = sum(v for _, _, v in moments) / m_total
+    return m_total, xcm, vcm
+
+
+def generate(n_particles, model='plummer', seed=42, imf=None, workers=None, **params):
+    """
+    Generate a whole model in memory
+    Returns mass, pos, vel with total mass 1 and the centre of mass at rest
+    """
+    tasks = block_tasks(n_particles, model, seed, imf, **params)
+    with Pool(workers) as pool:
+        m_total, xcm, vcm = centre_of_mass(pool, tasks)
+        blocks = pool.starmap(corrected_block, [(t, m_total, xcm, vcm) for t in tasks])
+    mass = np.concatenate([b[1] for b in blocks])
+    pos = np.concatenate([b[2] for b in blocks])
+    vel = np.concatenate([b[3] for b in blocks])
+    return mass, pos, vel
+
+
+def write_model(filename, n_particles, model='plummer', seed=42, imf=None,
+                workers=None, binary=False, **params):
+    """
+    Write a model as a phi-GPU input file (or .nbs with binary=True)
+    Blocks are regenerated in the second pass, so memory stays bounded
+    and text formatting runs in the workers.
+    """
+    tasks = block_tasks(n_particles, model, seed, imf, **params)
+    with Pool(workers) as pool:
+        m_total, xcm, vcm = centre_of_mass(pool, tasks)
+        args = [(t, m_total, xcm, vcm) for t in tasks]
+
+        if binary:
+            with BinaryWriter(filename, 0, n_particles, 0.0) as writer:
+                for start, mass, pos, vel in pool.imap(_corrected_block_args, args):
+                    writer.write_rows(start, {
+                        'id': np.arange(start, start + len(mass)), 'mass': mass,
+                        'x': pos[:, 0], 'y': pos[:, 1], 'z': pos[:, 2],
+                        'vx': vel[:, 0], 'vy': vel[:, 1], 'vz': vel[:, 2]})
+            return
+
+        with open(filename, 'w') as f:
+            # Header: diskstep, nbody, time
+            f.write(f"0\n{n_particles}\n0.0\n")
+            for text in pool.imap(format_block, args):
+                f.write(text)
+
+
+def _corrected_block_args(args):
+    return corrected_block(*args)
+
+
+def main():
+    """
+    Main function
+    """
+    args = sys.argv[1:]
+    if len(args) < 3:
+        print("Initial Conditions Generator")
+        print("\nUsage:")
+        print("  python initial_conditions.py <model> <N> <output> [options]")
+        print("\nModels: " + ", ".join(MODELS))
+        print("\nOptions:")
+        print("  --seed S       Random seed (default 42)")
+        print("  --workers P    Worker processes (default: all cores)")
+        print("  --imf NAME     Multi-mass IMF: " + ", ".join(IMFS))
+        print("  --w0 W         King central potential depth (default 6)")
+        print("  --binary       Write the binary .nbs format")
+        print("\nExample:")
+        print("  python initial_conditions.py king 100000 ../dat/king_w6.inp --w0 6 --imf kroupa")
+        sys.exit(1)
+
+    binary = '--binary' in args
+    args = [a for a in args if a != '--binary']
+    model, n, filename = args[0], int(args[1]), args[2]
+    options = dict(zip(args[3::2], args[4::2]))
+    params = {'w0': float(options['--w0'])} if model == 'king' and '--w0' in options else {}
+
+    print(f"Generating {model} model with N={n} particles...")
+    write_model(filename, n, model=model,
+                seed=int(options.get('--seed', 42)),
+                imf=options.get('--imf'),
+                workers=int(options['--workers']) if '--workers' in options else None,
+                binary=binary,
+                **params)
+    print(f"File {filename} created successfully.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Level of Detail
+Stratified subsample of a snapshot for scatter plots at large N: every
+particle of the dense core is kept, and the halo is thinned shell by
+shell (log-spaced in radius) so that sparse outer shells keep all their
+points while dense ones are cut down to a common quota. The total stays
+within a point budget, so plotting time is roughly independent of N.
+"""
+
+import numpy as np
+
+from cluster_analysis import shrinking_sphere_centre
+
+DEFAULT_BUDGET = 20000
+# Share of the budget given to the core (all of its particles are kept)
+CORE_SHARE = 0.25
+HALO_SHELLS = 32
+
+
+def shell_quota(counts, budget):
+    """
+    Water-filling: the largest quota q with sum(min(counts, q)) <= budget
+    Returns the number of points to keep in each shell
+    """
+    if counts.sum() <= budget:
+        return counts.copy()
+    sorted_counts = np.sort(counts)
+    # Points kept if the quota equals each sorted count
+    kept = np.cumsum(sorted_counts) + sorted_counts * (len(counts) - 1 - np.arange(len(counts)))
+    k = np.searchsorted(kept, budget, side='right')
+    below = sorted_counts[:k].sum()
+    q = (budget - below) / (len(counts) - k)
+    return np.minimum(counts, q)
+
+
+def stratified_subsample(pos, mass=None, budget=DEFAULT_BUDGET, centre=None, seed=0):
+    """
+    Indices of the particles to draw (at most about budget of them)
+    Returns: kept indices, centre
+    """
+    n = len(pos)
+    if centre is None:
+        centre = shrinking_sphere_centre(pos, np.ones(n) if mass is None else mass)
+    if n <= budget:
+        return np.arange(n), centre
+
+    r = np.sqrt(np.sum((pos - centre)**2, axis=1))
+    n_core = int(CORE_SHARE * budget)
+    # O(N) selection of the innermost n_core particles
+    core = np.argpartition(r, n_core)[:n_core]
+    r_core = r[core].max()
+
+    halo = np.flatnonzero(r > r_core)
+    r_halo = r[halo]
+    edges = np.geomspace(r_core, r_halo.max() * (1.0 + 1e-9), HALO_SHELLS + 1)
+    shell = np.clip(np.searchsorted(edges, r_halo, side='right') - 1, 0, HALO_SHELLS - 1)
+    counts = np.bincount(shell, minlength=HALO_SHELLS)
+    quota = shell_quota(counts, budget - n_core)
+
+    # Keep each halo particle with the probability of its shell
+    with np.errstate(invalid='ignore', divide='ignore'):
+        keep_prob = np.where(counts > 0, quota / counts, 0.0)
+    rng = np.random.default_rng(seed)
+    kept_halo = halo[rng.random(len(halo)) < keep_prob[shell]]
+    return np.concatenate([core, kept_halo]), centre
+
+
+def dropped_density(pos, kept, bins=100, extent=None):
+    """
+    2D (x, y) histogram of the particles left out of the subsample,
+    for a density-shaded background
+    Returns: H, x edges, y edges
+    """
+    mask = np.ones(len(pos), dtype=bool)
+    mask[kept] = False
+    dropped = pos[mask]
+    if extent is None:
+        extent = [[pos[:, 0].min(), pos[:, 0].max()], [pos[:, 1].min(), pos[:, 1].max()]]
+    return np.histogram2d(dropped[:, 0], dropped[:, 1], bins=bins, range=extent)
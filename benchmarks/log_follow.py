@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""
+Log Follower
+Incremental reader for outputs/contr.dat and the engine stdout
+(nbody_*.out): each poll parses only the complete lines appended
+since the previous one
+"""
+
+import os
+import sys
+import time
+
+import numpy as np
+
+# Columns written by energy() in phi-GPU.cpp
+CONTR_COLUMNS = ('time', 'timesteps', 'n_act_sum', 'E_pot', 'E_kin', 'E_tot', 'dE',
+                 'rcm', 'vcm', 'mom_x', 'mom_y', 'mom_z', 't_real', 't_user', 't_sys')
+STDOUT_COLUMNS = ('time', 'timesteps', 'n_act_sum', 'E_pot', 'E_kin', 'E_tot', 'dE',
+                  't_user')
+
+# Bytes at the start of the file used to recognise it between polls. Several
+# lines, so that two runs with the same initial conditions (identical first
+# energy line) still differ in their timing columns.
+FINGERPRINT_BYTES = 4096
+
+
+class LogFollower:
+    """
+    Follows a growing text log of numeric rows with a fixed column count
+
+    Lines with a different field count or non-numeric fields (headers,
+    'Timesteps = ...', profiling lines) are skipped. If the file shrinks,
+    is replaced (new inode) or its first bytes change (truncated and
+    rewritten past the old offset between polls) the follower starts over
+    from byte 0.
+    """
+
+    def __init__(self, path, ncols):
+        self.path = path
+        self.ncols = ncols
+        self.offset = 0
+        self.inode = None
+        self.head = b''
+        self.restarted = False
+        self._chunks = []
+        self._data = None
+
+    def reset(self):
+        """Forget everything read so far"""
+        self.offset = 0
+        self.head = b''
+        self._chunks = []
+        self._data = None
+
+    @property
+    def data(self):
+        """All rows read so far, shape (n, ncols)"""
+        if self._data is None:
+            if self._chunks:
+                self._data = np.concatenate(self._chunks)
+                self._chunks = [self._data]
+            else:
+                self._data = np.empty((0, self.ncols))
+        return self._data
+
+    def poll(self):
+        """
+        Read newly appended complete lines
+        Returns the new rows, shape (k, ncols); also sets self.restarted
+        when truncation or rotation discarded the earlier rows.
+        """
+        self.restarted = False
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return np.empty((0, self.ncols))
+
+        with open(self.path, 'rb') as f:
+            replaced = stat.st_ino != self.inode or stat.st_size < self.offset
+            if not replaced and self.head:
+                replaced = f.read(len(self.head)) != self.head
+            if replaced:
+                self.restarted = self.inode is not None
+                self.inode = stat.st_ino
+                self.reset()
+
+            if stat.st_size == self.offset:
+                return np.empty((0, self.ncols))
+
+            if len(self.head) < FINGERPRINT_BYTES:
+                f.seek(0)
+                self.head = f.read(min(FINGERPRINT_BYTES, stat.st_size))
+            f.seek(self.offset)
+            chunk = f.read(stat.st_size - self.offset)
+
+        # Leave a trailing partial line for the next poll
+        end = chunk.rfind(b'\n')
+        if end < 0:
+            return np.empty((0, self.ncols))
+        self.offset += end + 1
+
+        rows = parse_rows(chunk[:end].decode(errors='replace').splitlines(), self.ncols)
+        if len(rows):
+            self._chunks.append(rows)
+            self._data = None
+        return rows
+
+
+def parse_rows(lines, ncols):
+    """Parse the lines that hold exactly ncols numeric fields"""
+    fields = [line.split() for line in lines]
+    fields = [f for f in fields if len(f) == ncols]
+    if not fields:
+        return np.empty((0, ncols))
+    try:
+        return np.array(fields, dtype=np.float64)
+    except ValueError:
+        # Some candidate lines are text with the right field count
+        good = []
+        for f in fields:
+            try:
+                good.append([float(x) for x in f])
+            except ValueError:
+                continue
+        return np.array(good, dtype=np.float64).reshape(-1, ncols)
+
+
+def follow(path, ncols, interval=5.0):
+    """Yield the new rows of path every interval seconds, forever"""
+    follower = LogFollower(path, ncols)
+    while True:
+        rows = follower.poll()
+        if len(rows) or follower.restarted:
+            yield follower, rows
+        time.sleep(interval)
+
+
+def main():
+    """
+    Print new energy rows as they are appended (like tail -f)
+    """
+    path = sys.argv[1] if len(sys.argv) > 1 else '../outputs/contr.dat'
+    ncols = len(CONTR_COLUMNS) if path.endswith('contr.dat') else len(STDOUT_COLUMNS)
+    print(f"Following {path} ({ncols} columns), Ctrl-C to stop")
+    try:
+        for follower, rows in follow(path, ncols, interval=2.0):
+            if follower.restarted:
+                print("-- file truncated or rotated, restarting --")
+            for row in rows:
+                print(f"t={row[0]:10.4f}  E={row[5]: .8E}  dE={row[6]: .3E}")
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""
+Octree
+Morton-ordered octree built with vectorized NumPy passes, one per level.
+Particles are sorted by Morton key, so every node covers a contiguous
+range [start, end) of the sorted order and the children of a node are
+contiguous in the node arrays.
+"""
+
+import numpy as np
+
+# Bits per axis of the Morton key (3 * 21 = 63 bits)
+MORTON_BITS = 21
+MAX_LEVEL = MORTON_BITS
+DEFAULT_LEAF_SIZE = 16
+
+
+def spread_bits(v):
+    """Insert two zero bits between each of the low 21 bits of v (uint64)"""
+    v = v & np.uint64(0x1fffff)
+    v = (v | v << np.uint64(32)) & np.uint64(0x1f00000000ffff)
+    v = (v | v << np.uint64(16)) & np.uint64(0x1f0000ff0000ff)
+    v = (v | v << np.uint64(8)) & np.uint64(0x100f00f00f00f00f)
+    v = (v | v << np.uint64(4)) & np.uint64(0x10c30c30c30c30c3)
+    v = (v | v << np.uint64(2)) & np.uint64(0x1249249249249249)
+    return v
+
+
+def morton_keys(pos, lo, size):
+    """Morton keys of pos inside the cube [lo, lo + size)"""
+    scale = (1 << MORTON_BITS) / size
+    q = np.floor((pos - lo) * scale)
+    q = np.clip(q, 0, (1 << MORTON_BITS) - 1).astype(np.uint64)
+    return spread_bits(q[:, 0]) | (spread_bits(q[:, 1]) << np.uint64(1)) | (spread_bits(q[:, 2]) << np.uint64(2))
+
+
+def ranges_to_indices(starts, ends):
+    """Concatenation of arange(s, e) for every (s, e) pair, without a Python loop"""
+    lengths = ends - starts
+    total = int(lengths.sum())
+    if total == 0:
+        return np.empty(0, dtype=np.int64)
+    offsets = np.cumsum(lengths) - lengths
+    return np.arange(total, dtype=np.int64) - np.repeat(offsets - starts, lengths)
+
+
+def range_reduce(ufunc, values, starts, ends):
+    """ufunc reduction of values[s:e] for every non-empty (s, e) pair"""
+    padded = np.concatenate([values, values[-1:]])
+    bounds = np.column_stack([starts, ends]).ravel()
+    return ufunc.reduceat(padded, bounds, axis=0)[::2]
+
+
+class Octree:
+    """
+    Node arrays (one entry per node, root first, level by level):
+      start, end     particle range in sorted order
+      level          depth (root = 0); geometric width = size / 2**level
+      first_child    index of the first child (-1 for leaves)
+      n_child        number of children
+      bbox_lo/hi     tight bounding box of the node's particles
+    order maps sorted position -> original particle index.
+    """
+
+    def __init__(self, pos, leaf_size=DEFAULT_LEAF_SIZE):
+        pos = np.asarray(pos, dtype=np.float64)
+        self.leaf_size = leaf_size
+        self.lo = pos.min(axis=0)
+        extent = (pos.max(axis=0) - self.lo).max()
+        # Slightly enlarged so the farthest particle stays inside the cube
+        self.size = extent * (1.0 + 1e-9) if extent > 0 else 1.0
+
+        keys = morton_keys(pos, self.lo, self.size)
+        self.order = np.argsort(keys, kind='stable')
+        self.keys = keys[self.order]
+        self.pos = pos[self.order]
+        self._build()
+
+    def _build(self):
+        n = len(self.keys)
+        starts = [np.array([0])]
+        ends = [np.array([n])]
+        levels = [np.array([0])]
+        parents = [np.array([-1])]
+
+        level_start, level_end = starts[0], ends[0]
+        level_offset = 0
+        for level in range(MAX_LEVEL):
+            split = np.flatnonzero(level_end - level_start > self.leaf_size)
+            if not len(split):
+                break
+            # Particles of the split nodes, grouped by their next-level cell
+            idx = ranges_to_indices(level_start[split], level_end[split])
+            shift = np.uint64(3 * (MORTON_BITS - level - 1))
+            prefix = self.keys[idx] >> shift
+            new = np.ones(len(idx), dtype=bool)
+            new[1:] = (prefix[1:] != prefix[:-1]) | (idx[1:] != idx[:-1] + 1)
+            child_start = idx[new]
+            child_end = np.append(idx[np.flatnonzero(new)[1:] - 1] + 1, idx[-1] + 1)
+
+            # Parent of each child: the split node whose range contains it
+            parent_local = np.searchsorted(level_start[split], child_start, side='right') - 1
+            parents.append(level_offset + split[parent_local])
+            starts.append(child_start)
+            ends.append(child_end)
+            levels.append(np.full(len(child_start), level + 1))
+
+            level_offset += len(level_start)
+            level_start, level_end = child_start, child_end
+
+        self.start = np.concatenate(starts)
+        self.end = np.concatenate(ends)
+        self.level = np.concatenate(levels)
+        parent = np.concatenate(parents)
+
+        n_nodes = len(self.start)
+        self.n_child = np.bincount(parent[1:], minlength=n_nodes)
+        self.first_child = np.full(n_nodes, -1, dtype=np.int64)
+        # Children are stored contiguously, in parent order
+        child_ids = np.arange(1, n_nodes)
+        first = np.ones(len(child_ids), dtype=bool)
+        first[1:] = parent[2:] != parent[1:-1]
+        self.first_child[parent[1:][first]] = child_ids[first]
+
+        self.width = self.size / 2.0**self.level
+        self.bbox_lo = range_reduce(np.minimum, self.pos, self.start, self.end)
+        self.bbox_hi = range_reduce(np.maximum, self.pos, self.start, self.end)
+
+    @property
+    def is_leaf(self):
+        return self.n_child == 0
+
+    def __len__(self):
+        return len(self.start)
+
+    def children(self, nodes):
+        """All children of the given nodes, plus the index of their parent in nodes"""
+        counts = self.n_child[nodes]
+        kids = ranges_to_indices(self.first_child[nodes], self.first_child[nodes] + counts)
+        return kids, np.repeat(np.arange(len(nodes)), counts)
+
+    def moments(self, mass):
+        """
+        Monopole moments of every node for the given (unsorted) masses
+        Returns: node mass (n_nodes,), centre of mass (n_nodes, 3)
+        """
+        ms = np.asarray(mass, dtype=np.float64)[self.order]
+        cum_m = np.concatenate([[0.0], np.cumsum(ms)])
+        cum_mx = np.vstack([np.zeros(3), np.cumsum(ms[:, None] * self.pos, axis=0)])
+        node_mass = cum_m[self.end] - cum_m[self.start]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            com = (cum_mx[self.end] - cum_mx[self.start]) / node_mass[:, None]
+        # Massless nodes: fall back to the geometric centre of the particles
+        empty = ~(node_mass > 0)
+        com[empty] = 0.5 * (self.bbox_lo[empty] + self.bbox_hi[empty])
+        return node_mass, com
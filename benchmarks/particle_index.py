@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+"""
+Particle Index
+Per-run id -> row index of every snapshot file, built once and stored
+next to the snapshots, so the trajectories of a few particles can be
+read without loading whole snapshots. Snapshots are written in ptcl
+array order, which may differ between snapshots; each distinct order
+is stored only once.
+
+Unlike run_store.RunStore, no copy of the particle data is made: rows
+are read straight from the .nbs files (or the snapshot cache for text
+snapshots).
+"""
+
+import glob
+import json
+import os
+import sys
+
+import numpy as np
+
+from convert_snapshots import binary_path
+from results_table import file_identity
+from run_store import SNAPSHOT_PATTERN
+from snapshot_io import is_binary, open_binary, read_rows, read_snapshot
+
+INDEX_DIR = 'particle_index'
+
+
+def snapshot_source(filename):
+    """The .nbs copy of a text snapshot if it is up to date, else the file itself"""
+    nbs = binary_path(filename)
+    if os.path.exists(nbs) and os.path.getmtime(nbs) >= os.path.getmtime(filename):
+        return nbs
+    return filename
+
+
+def read_ids(filename):
+    """Particle ids in file order (time, ids)"""
+    source = snapshot_source(filename)
+    if is_binary(source):
+        diskstep, nbody, time, cols = open_binary(source)
+        return time, np.array(cols['id'])
+    diskstep, nbody, time, particles = read_snapshot(source, columns=('id',))
+    return time, particles['id']
+
+
+class ParticleIndex:
+    """
+    Index of one outputs directory
+
+    Layout of the index directory:
+      meta.json  - indexed snapshot files: identity, time, order slot
+      ids.npy    - sorted particle ids
+      rows.npy   - (n_orders, N) row of each sorted id, one per distinct order
+    """
+
+    def __init__(self, outputs_dir='../outputs', path=None):
+        self.outputs_dir = outputs_dir
+        self.path = path or os.path.join(outputs_dir, INDEX_DIR)
+        self.snapshots = {}
+        self.ids = None
+        self.rows = None
+
+        meta_file = os.path.join(self.path, 'meta.json')
+        if os.path.exists(meta_file):
+            with open(meta_file, 'r') as f:
+                self.snapshots = json.load(f)['snapshots']
+            self.ids = np.load(os.path.join(self.path, 'ids.npy'))
+            self.rows = np.load(os.path.join(self.path, 'rows.npy'))
+
+    def __len__(self):
+        return len(self.snapshots)
+
+    @property
+    def nbody(self):
+        return None if self.ids is None else len(self.ids)
+
+    def files(self):
+        """Indexed snapshot files, in time order"""
+        names = sorted(self.snapshots, key=lambda name: self.snapshots[name]['time'])
+        return [os.path.join(self.outputs_dir, name) for name in names]
+
+    @property
+    def times(self):
+        return np.array([self.snapshots[os.path.basename(f)]['time'] for f in self.files()])
+
+    def _save(self):
+        os.makedirs(self.path, exist_ok=True)
+        np.save(os.path.join(self.path, 'ids.npy'), self.ids)
+        np.save(os.path.join(self.path, 'rows.npy'), self.rows)
+        # meta.json last: it only references orders already on disk
+        tmp = os.path.join(self.path, 'meta.json.tmp')
+        with open(tmp, 'w') as f:
+            json.dump({'snapshots': self.snapshots}, f)
+        os.replace(tmp, os.path.join(self.path, 'meta.json'))
+
+    def _order_slot(self, file_ids):
+        """Slot of the row order of a snapshot, adding it if new"""
+        order = np.argsort(file_ids, kind='stable')
+        if self.ids is None:
+            self.ids = file_ids[order]
+            self.rows = order[None, :]
+            return 0
+        if len(file_ids) != len(self.ids) or not np.array_equal(file_ids[order], self.ids):
+            raise ValueError(f"Particle set differs from the index ({len(file_ids)} vs {len(self.ids)})")
+        for slot, rows in enumerate(self.rows):
+            if np.array_equal(rows, order):
+                return slot
+        self.rows = np.vstack([self.rows, order])
+        return len(self.rows) - 1
+
+    def update(self, pattern=SNAPSHOT_PATTERN):
+        """
+        Index the snapshot files of outputs_dir that are new or changed
+        Only the id column of those files is read.
+        Returns the number of snapshots indexed
+        """
+        added = 0
+        for filename in sorted(glob.glob(os.path.join(self.outputs_dir, pattern))):
+            name = os.path.basename(filename)
+            identity = file_identity(filename)
+            entry = self.snapshots.get(name)
+            if entry is not None and entry['identity'] == identity:
+                continue
+            time, file_ids = read_ids(filename)
+            self.snapshots[name] = {'identity': identity, 'time': float(time),
+                                    'order': self._order_slot(file_ids)}
+            added += 1
+        if added:
+            self._save()
+        return added
+
+    def positions_of(self, ids):
+        """Positions of the given ids in the sorted id array"""
+        ids = np.asarray(ids)
+        k = np.searchsorted(self.ids, ids)
+        if np.any(k >= len(self.ids)) or np.any(self.ids[np.minimum(k, len(self.ids) - 1)] != ids):
+            raise KeyError("Unknown particle id")
+        return k
+
+    def rows_in(self, filename, ids):
+        """Rows of the given ids in one indexed snapshot file"""
+        slot = self.snapshots[os.path.basename(filename)]['order']
+        return self.rows[slot][self.positions_of(ids)]
+
+    def trajectories(self, ids, files=None):
+        """
+        Positions and velocities of the given ids in every indexed snapshot
+        (or in files), read row by row from each file
+        Returns: times (n_snap,), states (n_snap, k, 6) as x, y, z, vx, vy, vz
+        """
+        files = self.files() if files is None else files
+        k = self.positions_of(ids)
+        times = np.empty(len(files))
+        states = np.empty((len(files), len(k), 6))
+        for s, filename in enumerate(files):
+            slot = self.snapshots[os.path.basename(filename)]['order']
+            diskstep, nbody, time, particles = read_rows(snapshot_source(filename), self.rows[slot][k],
+                                                         columns=('pos', 'vel'))
+            times[s] = time
+            states[s, :, 0:3] = particles['pos']
+            states[s, :, 3:6] = particles['vel']
+        return times, states
+
+
+def main():
+    """
+    Build or update the particle index of an outputs directory, and
+    optionally print the trajectory of some ids
+    """
+    outputs_dir = sys.argv[1] if len(sys.argv) > 1 else '../outputs'
+    index = ParticleIndex(outputs_dir)
+    added = index.update()
+    print(f"Indexed {added} new snapshots in {index.path}")
+    if not len(index):
+        return
+    print(f"Index: {len(index)} snapshots, N={index.nbody}, {len(index.rows)} distinct row orders")
+
+    if len(sys.argv) > 2:
+        ids = [int(i) for i in sys.argv[2].split(',')]
+        times, states = index.trajectories(ids)
+        for j, pid in enumerate(ids):
+            print(f"\nid {pid}:")
+            for t, state in zip(times, states[:, j]):
+                print(f"  t={t:<9.3f} " + " ".join(f"{x: .5f}" for x in state))
+
+
+if __name__ == '__main__':
+    main()
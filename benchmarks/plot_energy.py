@@ -1,6 +1,10 @@
 import matplotlib.pyplot as plt
 import numpy as np
 import os
+import sys
+import time
+
+from log_follow import STDOUT_COLUMNS, LogFollower
 
 # Configuration
 input_file = "outputs/nbody_m15_25889.out"
@@ -8,61 +12,70 @@ output_dir = "informe"
 os.makedirs(output_dir, exist_ok=True)
 output_path = os.path.join(output_dir, "energy_conservation.png")
 
-times = []
-energies = []
+follower = LogFollower(input_file, len(STDOUT_COLUMNS))
 
-print(f"Reading {input_file}...")
+def energy_series():
+    """Time and energy of the stdout energy lines read so far (Time 0 to 50)"""
+    data = follower.data
+    times = data[:, 0]
+    keep = (times >= 0) & (times <= 50.1)
+    return times[keep], data[keep, 3]
 
-with open(input_file, 'r') as f:
-    for line in f:
-        # Filter relevant lines (data lines start with a number)
-        parts = line.split()
-        if len(parts) >= 8:
-            try:
-                t = float(parts[0])
-                e = float(parts[3])
-                
-                # Check bounds (Time 0 to 50)
-                if 0 <= t <= 50.1:
-                    times.append(t)
-                    energies.append(e)
-            except ValueError:
-                continue
+print(f"Reading {input_file}...")
+follower.poll()
+times, energies = energy_series()
 
 print(f"Found {len(times)} data points.")
 
-# Plotting
-plt.figure(figsize=(10, 6))
-plt.plot(times, energies, linewidth=2, color='#e74c3c', label='Total Energy')
-
-# Formatting
-plt.title('Conservación de Energía (Validación Científica)', fontsize=14, fontweight='bold')
-plt.xlabel('Tiempo de Simulación (Unidades N-Body)', fontsize=12)
-plt.ylabel('Energía Total (E)', fontsize=12)
-plt.grid(True, linestyle='--', alpha=0.6)
-
-# Calculate stats for annotation
-e0 = energies[0]
-end = energies[-1]
-err = abs(end - e0) / abs(e0) * 100
-mean_e = np.mean(energies)
-
-# Dynamic Y-axis limits to show the variation (don't zoom too much if it's flat)
-plt.ylim(min(energies)*1.005, max(energies)*0.995) 
-
-# Add text box with statistics
-textstr = '\n'.join((
-    r'$E_{inicial}=%.4f$' % (e0, ),
-    r'$E_{final}=%.4f$' % (end, ),
-    r'Error Relativo=%.2f%%' % (err, )))
-
-props = dict(boxstyle='round', facecolor='wheat', alpha=0.5)
-plt.gca().text(0.05, 0.95, textstr, transform=plt.gca().transAxes, fontsize=10,
-        verticalalignment='top', bbox=props)
-
-plt.legend()
-plt.tight_layout()
-
-plt.savefig(output_path, dpi=300)
-print(f"Generated plot: {output_path}")
-print(textstr)
+def plot_energy(times, energies):
+    # Plotting
+    plt.figure(figsize=(10, 6))
+    plt.plot(times, energies, linewidth=2, color='#e74c3c', label='Total Energy')
+
+    # Formatting
+    plt.title('Conservación de Energía (Validación Científica)', fontsize=14, fontweight='bold')
+    plt.xlabel('Tiempo de Simulación (Unidades N-Body)', fontsize=12)
+    plt.ylabel('Energía Total (E)', fontsize=12)
+    plt.grid(True, linestyle='--', alpha=0.6)
+
+    # Calculate stats for annotation
+    e0 = energies[0]
+    end = energies[-1]
+    err = abs(end - e0) / abs(e0) * 100
+    mean_e = np.mean(energies)
+
+    # Dynamic Y-axis limits to show the variation (don't zoom too much if it's flat)
+    plt.ylim(min(energies)*1.005, max(energies)*0.995) 
+
+    # Add text box with statistics
+    textstr = '\n'.join((
+        r'$E_{inicial}=%.4f$' % (e0, ),
+        r'$E_{final}=%.4f$' % (end, ),
+        r'Error Relativo=%.2f%%' % (err, )))
+
+    props = dict(boxstyle='round', facecolor='wheat', alpha=0.5)
+    plt.gca().text(0.05, 0.95, textstr, transform=plt.gca().transAxes, fontsize=10,
+            verticalalignment='top', bbox=props)
+
+    plt.legend()
+    plt.tight_layout()
+
+    plt.savefig(output_path, dpi=300)
+    print(f"Generated plot: {output_path}")
+    print(textstr)
+    plt.close()
+
+plot_energy(times, energies)
+
+# --follow: keep watching the log of a running job, parsing only new lines
+if '--follow' in sys.argv[1:]:
+    print(f"Following {input_file}, Ctrl-C to stop")
+    try:
+        while True:
+            time.sleep(10)
+            rows = follower.poll()
+            if len(rows) or follower.restarted:
+                times, energies = energy_series()
+                plot_energy(times, energies)
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+"""
+Radial Profiles
+Density, velocity dispersion, anisotropy beta(r) and enclosed mass in
+log-spaced radial shells, all from one np.bincount pass per quantity.
+Profiles of every snapshot of a run are computed in a process pool and
+stored in the "profiles" results table, so only new snapshots cost
+anything; the analytic Plummer profile (FISICA_CONTEXT.md) is provided
+for comparison.
+"""
+
+import glob
+import os
+import sys
+from multiprocessing import Pool
+
+import numpy as np
+
+from cluster_analysis import centre_of_mass, shrinking_sphere_centre
+from results_table import ResultsTable
+from run_store import SNAPSHOT_PATTERN
+from snapshot_io import read_snapshot
+
+# Bump when radial_profile changes to invalidate stored profiles
+PROFILE_VERSION = 2
+
+# Fixed edges (N-body units) so that profiles of a run can be compared
+R_MIN = 1e-2
+R_MAX = 1e2
+PROFILE_BINS = 40
+
+
+def radial_profile(pos, vel, mass, centre=None, r_min=R_MIN, r_max=R_MAX, bins=PROFILE_BINS):
+    """
+    Radial profiles in bins log-spaced shells between r_min and r_max
+    Velocities are taken relative to the centre-of-mass velocity;
+    beta = 1 - sigma_t^2 / (2 sigma_r^2), sigma_t^2 summing both
+    tangential components. Particles inside r_min still count in m_enclosed,
+    the mass inside the outer edge r_outer of each shell (not inside r).
+    Returns a dict of arrays (r_edges has bins + 1 entries, the rest bins)
+    """
+    if centre is None:
+        centre = shrinking_sphere_centre(pos, mass)
+    dx = pos - centre
+    dv = vel - centre_of_mass(vel, mass)
+    r = np.sqrt(np.sum(dx**2, axis=1))
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        v_r = np.where(r > 0, np.sum(dx * dv, axis=1) / r, 0.0)
+    v_t2 = np.sum(dv**2, axis=1) - v_r**2
+
+    # Shell index: 0 below r_min, bins + 1 beyond r_max
+    log_edges = np.linspace(np.log10(r_min), np.log10(r_max), bins + 1)
+    with np.errstate(divide='ignore'):
+        shell = np.floor((np.log10(r) - log_edges[0]) / (log_edges[1] - log_edges[0])).astype(np.int64) + 1
+    shell = np.clip(shell, 0, bins + 1)
+
+    def shell_sum(weights):
+        return np.bincount(shell, weights=weights, minlength=bins + 2)
+
+    count = np.bincount(shell, minlength=bins + 2)
+    m = shell_sum(mass)
+    mv_r = shell_sum(mass * v_r)
+    mv_r2 = shell_sum(mass * v_r**2)
+    mv_t2 = shell_sum(mass * v_t2)
+
+    edges = 10.0**log_edges
+    volume = (4.0 / 3.0) * np.pi * (edges[1:]**3 - edges[:-1]**3)
+    inner = slice(1, bins + 1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean_vr = mv_r[inner] / m[inner]
+        sigma_r2 = mv_r2[inner] / m[inner] - mean_vr**2
+        sigma_t2 = mv_t2[inner] / m[inner]
+        # A dispersion needs at least two particles
+        sigma_r2[count[inner] < 2] = np.nan
+        sigma_t2[count[inner] < 2] = np.nan
+        beta = 1.0 - sigma_t2 / (2.0 * sigma_r2)
+
+    return {
+        'r_edges': edges,
+        'r': np.sqrt(edges[1:] * edges[:-1]),
+        'r_outer': edges[1:],
+        'count': count[inner],
+        'density': m[inner] / volume,
+        'sigma_r': np.sqrt(np.maximum(sigma_r2, 0.0)),
+        'sigma_t': np.sqrt(sigma_t2 / 2.0),
+        'beta': beta,
+        'm_enclosed': m[0] + np.cumsum(m[inner]),
+        'centre': centre,
+    }
+
+
+def plummer_profile(r, a=1.0, m_total=1.0):
+    """
+    Analytic Plummer (1911) profiles, G = 1
+    Returns: density, m_enclosed, sigma (1D, isotropic: beta = 0)
+    """
+    r = np.asarray(r, dtype=np.float64)
+    s2 = r**2 + a**2
+    density = 3.0 * m_total / (4.0 * np.pi * a**3) * (1.0 + r**2 / a**2)**-2.5
+    m_enclosed = m_total * r**3 / s2**1.5
+    sigma = np.sqrt(m_total / (6.0 * np.sqrt(s2)))
+    return density, m_enclosed, sigma
+
+
+def snapshot_profile(filename):
+    """Worker: profiles of one snapshot file"""
+    diskstep, nbody, time, particles = read_snapshot(filename, columns=('mass', 'pos', 'vel'))
+    profile = radial_profile(particles['pos'], particles['vel'], particles['mass'])
+    return filename, time, profile
+
+
+def run_profiles(outputs_dir='../outputs', processes=None):
+    """
+    Profiles of every snapshot of a run; only snapshots missing from
+    (or changed since) the results table are computed
+    Returns the table rows in time order
+    """
+    files = sorted(glob.glob(os.path.join(outputs_dir, SNAPSHOT_PATTERN)))
+    table = ResultsTable(outputs_dir, 'profiles', version=PROFILE_VERSION)
+    pending = table.pending(files)
+    if pending:
+        with Pool(processes) as pool:
+            for filename, time, profile in pool.imap_unordered(snapshot_profile, pending):
+                table.put(filename, time, profile)
+                table.save()
+    return table.select(files)
+
+
+def plot_profiles(rows, save='../visualizations/radial_profiles.png'):
+    """Profiles of the first and last snapshot against the Plummer model"""
+    import matplotlib.pyplot as plt
+
+    fig, axes = plt.subplots(2, 2, figsize=(14, 10))
+    r_model = np.logspace(np.log10(R_MIN), np.log10(R_MAX), 200)
+    rho_model, m_model, sigma_model = plummer_profile(r_model)
+
+    # Enclosed mass is plotted at the outer shell edges, where it is measured
+    panels = [
+        (axes[0, 0], 'density', 'r', rho_model, 'Density', True),
+        (axes[0, 1], 'sigma_r', 'r', sigma_model, 'Radial velocity dispersion', False),
+        (axes[1, 0], 'beta', 'r', np.zeros_like(r_model), 'Anisotropy beta(r)', False),
+        (axes[1, 1], 'm_enclosed', 'r_outer', m_model, 'Enclosed mass', False),
+    ]
+    for ax, key, r_key, model, title, log_y in panels:
+        ax.plot(r_model, model, 'k--', linewidth=1, label='Plummer (a = 1)')
+        for row, style in ((rows[0], 'b-'), (rows[-1], 'r-')):
+            profile = row['values']
+            ax.plot(profile[r_key], np.array(profile[key], dtype=np.float64), style,
+                    linewidth=2, label=f"t = {row['time']:.2f}")
+        ax.set_xscale('log')
+        if log_y:
+            ax.set_yscale('log')
+        ax.set_xlabel('r')
+        ax.set_title(title)
+        ax.legend()
+        ax.grid(True, alpha=0.3)
+
+    plt.tight_layout()
+    plt.savefig(save, dpi=150, bbox_inches='tight')
+    print(f"Saved {save}")
+
+
+def main():
+    """
+    Compute the profiles of a run and compare the last one with Plummer
+    """
+    args = [a for a in sys.argv[1:] if a != '--plot']
+    outputs_dir = args[0] if args else '../outputs'
+    rows = run_profiles(outputs_dir)
+    if not rows:
+        print(f"No snapshots in {outputs_dir}")
+        return
+
+    last = rows[-1]
+    profile = {k: np.array(v, dtype=np.float64) for k, v in last['values'].items()}
+    rho_model, _, sigma_model = plummer_profile(profile['r'])
+    _, m_model, _ = plummer_profile(profile['r_outer'])
+    print(f"{len(rows)} snapshots; profile at t={last['time']:.3f}:")
+    print(f"{'r':>9} {'N':>7} {'rho':>10} {'rho/Plummer':>11} {'sigma_r':>8} {'beta':>7} "
+          f"{'r_outer':>9} {'M(<r_out)':>9} {'Plummer':>7}")
+    for k in np.flatnonzero(profile['count'] > 0):
+        print(f"{profile['r'][k]:>9.4f} {int(profile['count'][k]):>7d} {profile['density'][k]:>10.3e} "
+              f"{profile['density'][k] / rho_model[k]:>11.3f} {profile['sigma_r'][k]:>8.4f} "
+              f"{profile['beta'][k]:>7.3f} {profile['r_outer'][k]:>9.4f} "
+              f"{profile['m_enclosed'][k]:>9.4f} {m_model[k]:>7.4f}")
+
+    if '--plot' in sys.argv:
+        plot_profiles(rows)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,346 @@
+#!/usr/bin/env python3
+"""
+Raster Renderer
+Projects particles through a rotating camera and splats them into a 2D
+image with np.bincount (surface density, optionally coloured by the
+mean speed of each pixel) on a log colour scale. Frames are rendered in
+a process pool and streamed, in order, to an ffmpeg pipe, a GIF or a
+PNG sequence. Cost per frame is O(N) with no matplotlib artists.
+In-between frames are drawn by cubic Hermite interpolation of positions
+and velocities between consecutive snapshots, so sparse snapshots still
+give a smooth movie.
+"""
+
+import os
+import shutil
+import subprocess
+import sys
+from multiprocessing import Pool
+
+import numpy as np
+from matplotlib import colormaps
+from PIL import Image, ImageDraw
+
+from run_store import RunStore
+from snapshot_io import read_header, read_snapshot
+
+DEFAULT_SIZE = 800
+# Dynamic range of the log colour scale (decades below the peak)
+LOG_DECADES = 4.0
+# PIL writes a GIF in one call, so every frame is held in memory until
+# then (one byte per pixel after quantization); longer movies need .mp4
+# or a PNG directory
+GIF_MAX_BYTES = 1 << 30
+
+
+def camera_matrix(azim, elev):
+    """
+    Rotation from world to camera coordinates (degrees, as view_init):
+    rows are the screen x axis, the screen y axis and the view direction
+    """
+    a, e = np.radians(azim), np.radians(elev)
+    view = np.array([np.cos(e) * np.cos(a), np.cos(e) * np.sin(a), np.sin(e)])
+    right = np.array([-np.sin(a), np.cos(a), 0.0])
+    up = np.cross(view, right)
+    return np.vstack([right, up, view])
+
+
+def splat(pos, matrix, extent, size=DEFAULT_SIZE, weights=None, values=None):
+    """
+    Project pos and accumulate onto a size x size grid covering
+    [-extent, extent] in screen coordinates
+    Returns: density image, mean of values per pixel (or None)
+    """
+    xy = pos @ matrix[:2].T
+    pix = np.floor((xy + extent) / (2.0 * extent) * size).astype(np.int64)
+    inside = np.all((pix >= 0) & (pix < size), axis=1)
+    pix = pix[inside]
+    # Image rows run top to bottom, screen y bottom to top
+    flat = (size - 1 - pix[:, 1]) * size + pix[:, 0]
+
+    w = None if weights is None else weights[inside]
+    density = np.bincount(flat, weights=w, minlength=size * size).reshape(size, size)
+    if values is None:
+        return density, None
+    wv = values[inside] if w is None else w * values[inside]
+    total = np.bincount(flat, weights=wv, minlength=size * size).reshape(size, size)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return density, total / density
+
+
+def to_rgb(density, peak, values=None, value_range=None, cmap='magma'):
+    """
+    RGB image (uint8): log density mapped through cmap, or, with values,
+    values mapped through cmap and shaded by log density
+    """
+    with np.errstate(divide='ignore'):
+        level = (np.log10(density) - (np.log10(peak) - LOG_DECADES)) / LOG_DECADES
+    level = np.clip(np.nan_to_num(level, nan=0.0, neginf=0.0), 0.0, 1.0)
+    colour_map = colormaps[cmap]
+    if values is None:
+        rgb = colour_map(level)[..., :3]
+        rgb[density <= 0] = 0.0
+    else:
+        lo, hi = value_range
+        shade = np.clip((np.nan_to_num(values, nan=lo) - lo) / (hi - lo), 0.0, 1.0)
+        rgb = colour_map(shade)[..., :3] * level[..., None]
+    return (rgb * 255).astype(np.uint8)
+
+
+def load_state(source):
+    """
+    Ids, positions, velocities, masses and time of a snapshot source,
+    rows in increasing id order:
+      ('file', path)               a snapshot file
+      ('store', outputs_dir, i)    snapshot i of a RunStore
+    """
+    kind = source[0]
+    if kind == 'file':
+        diskstep, nbody, time, particles = read_snapshot(source[1])
+        particles = particles[np.argsort(particles['id'], kind='stable')]
+        return particles['id'], particles['pos'], particles['vel'], particles['mass'], time
+    if kind == 'store':
+        store = RunStore(source[1])
+        state = store.states[source[2]]
+        return store.ids, state[:, 0:3], state[:, 3:6], store.mass, store.times[source[2]]
+    raise ValueError(f"Unknown snapshot source: {kind}")
+
+
+def hermite(x0, v0, x1, v1, h, s):
+    """
+    Cubic Hermite interpolation at fraction s of an interval of length h
+    with end positions x0, x1 and velocities v0, v1
+    Returns: positions, velocities
+    """
+    s2, s3 = s * s, s * s * s
+    pos = ((2 * s3 - 3 * s2 + 1) * x0 + (s3 - 2 * s2 + s) * h * v0
+           + (3 * s2 - 2 * s3) * x1 + (s3 - s2) * h * v1)
+    vel = ((6 * s2 - 6 * s) * (x0 - x1) / h + (3 * s2 - 4 * s + 1) * v0
+           + (3 * s2 - 2 * s) * v1)
+    return pos, vel
+
+
+# Snapshot pair of the last in-between frame of this process: consecutive
+# frames of an interval reuse it instead of reading both snapshots again
+_pair = {}
+
+
+def load_frame(source):
+    """
+    Positions, velocities, masses and time of a frame source: a snapshot
+    source (see load_state), or
+      ('between', a, b, s)         fraction s of the way from snapshot
+                                   source a to snapshot source b
+    """
+    if source[0] != 'between':
+        ids, pos, vel, mass, time = load_state(source)
+        return pos, vel, mass, time
+
+    a, b, s = source[1:]
+    if _pair.get('key') != (a, b):
+        _pair.clear()
+        ids0, x0, v0, mass, t0 = load_state(a)
+        ids1, x1, v1, _, t1 = load_state(b)
+        if not np.array_equal(ids0, ids1):
+            raise ValueError(f"Cannot interpolate: particle sets of {a} and {b} differ")
+        _pair.update(key=(a, b), start=(x0, v0, t0), end=(x1, v1, t1), mass=mass)
+    (x0, v0, t0), (x1, v1, t1) = _pair['start'], _pair['end']
+    pos, vel = hermite(x0, v0, x1, v1, t1 - t0, s)
+    return pos, vel, _pair['mass'], t0 + s * (t1 - t0)
+
+
+def between_sources(sources, times, frame_dt):
+    """
+    Frame sources at a constant simulation-time step frame_dt (at least
+    one frame per interval): each snapshot source, in time order,
+    followed by the interpolated frames up to the next one. Snapshots
+    with equal times (repeated dumps, restarts) get no frames in between,
+    and frame_dt <= 0 gives the snapshots alone.
+    """
+    order = np.argsort(times, kind='stable')
+    sources = [sources[k] for k in order]
+    times = [times[k] for k in order]
+    if frame_dt <= 0:
+        return sources
+
+    frames = []
+    for k in range(len(sources) - 1):
+        frames.append(sources[k])
+        h = times[k + 1] - times[k]
+        if h <= 0:
+            continue
+        n = max(1, int(round(h / frame_dt)))
+        frames.extend(('between', sources[k], sources[k + 1], j / n) for j in range(1, n))
+    frames.append(sources[-1])
+    return frames
+
+
+def render_frame(task):
+    """Worker: RGB image of one frame"""
+    source, azim, elev, settings = task
+    pos, vel, mass, time = load_frame(source)
+    matrix = camera_matrix(azim, elev)
+    size, extent = settings['size'], settings['extent']
+    if settings['colour'] == 'velocity':
+        speed = np.sqrt(np.sum(vel**2, axis=1))
+        density, mean_speed = splat(pos, matrix, extent, size, weights=mass, values=speed)
+        rgb = to_rgb(density, settings['peak'], mean_speed, settings['value_range'], settings['cmap'])
+    else:
+        density, _ = splat(pos, matrix, extent, size, weights=mass)
+        rgb = to_rgb(density, settings['peak'], cmap=settings['cmap'])
+
+    if settings.get('title'):
+        image = Image.fromarray(rgb)
+        ImageDraw.Draw(image).text((10, 10), settings['title'].format(time=time), fill=(255, 255, 255))
+        rgb = np.asarray(image)
+    return rgb
+
+
+class FFmpegSink:
+    """Raw RGB frames piped to ffmpeg (H.264)"""
+
+    def __init__(self, path, size, fps):
+        self.process = subprocess.Popen(
+            ['ffmpeg', '-y', '-loglevel', 'error', '-f', 'rawvideo', '-pix_fmt', 'rgb24',
+             '-s', f'{size}x{size}', '-r', str(fps), '-i', '-',
+             '-vcodec', 'libx264', '-pix_fmt', 'yuv420p', path],
+            stdin=subprocess.PIPE)
+
+    def write(self, rgb):
+        self.process.stdin.write(rgb.tobytes())
+
+    def close(self):
+        self.process.stdin.close()
+        if self.process.wait() != 0:
+            raise RuntimeError("ffmpeg failed")
+
+
+class GifSink:
+    """
+    Frames collected and written as one animated GIF
+    Frames stay in memory (palette images) until close, so at most
+    max_frames = GIF_MAX_BYTES / size^2 are accepted.
+    """
+
+    def __init__(self, path, size, fps):
+        self.path, self.fps, self.frames = path, fps, []
+        self.max_frames = max(1, GIF_MAX_BYTES // (size * size))
+
+    def write(self, rgb):
+        if len(self.frames) >= self.max_frames:
+            raise ValueError(f"GIF limited to {self.max_frames} frames; write .mp4 or a directory")
+        self.frames.append(Image.fromarray(rgb).quantize())
+
+    def close(self):
+        # Nothing to save if rendering failed before the first frame
+        if not self.frames:
+            return
+        self.frames[0].save(self.path, save_all=True, append_images=self.frames[1:],
+                            duration=int(1000 / self.fps), loop=0)
+
+
+class PngSink:
+    """Frames written as directory/frame_NNNNN.png"""
+
+    def __init__(self, directory, size, fps):
+        self.directory, self.count = directory, 0
+        os.makedirs(directory, exist_ok=True)
+
+    def write(self, rgb):
+        Image.fromarray(rgb).save(os.path.join(self.directory, f'frame_{self.count:05d}.png'))
+        self.count += 1
+
+    def close(self):
+        pass
+
+
+def open_sink(output, size, fps):
+    """Sink for output: .mp4 through ffmpeg (PNG frames if it is missing), .gif, or a directory"""
+    if output.endswith('.mp4'):
+        if shutil.which('ffmpeg'):
+            return FFmpegSink(output, size, fps), output
+        output = os.path.splitext(output)[0] + '_frames'
+        print(f"ffmpeg not found; writing a PNG sequence to {output}/")
+    elif output.endswith('.gif'):
+        return GifSink(output, size, fps), output
+    return PngSink(output, size, fps), output
+
+
+def frame_settings(source, size=DEFAULT_SIZE, colour='density', cmap='magma', extent=None,
+                   title='t = {time:.3f}'):
+    """
+    Scale settings shared by every frame, taken from one reference
+    frame so that brightness and colours stay constant through a movie
+    """
+    pos, vel, mass, time = load_frame(source)
+    if extent is None:
+        r = np.sqrt(np.sum((pos - np.median(pos, axis=0))**2, axis=1))
+        extent = 1.2 * np.percentile(r, 99)
+    density, _ = splat(pos, camera_matrix(0.0, 90.0), extent, size, weights=mass)
+    speed = np.sqrt(np.sum(vel**2, axis=1))
+    return {'size': size, 'extent': float(extent), 'peak': float(density.max()),
+            'colour': colour, 'cmap': cmap, 'title': title,
+            'value_range': (float(np.percentile(speed, 1)), float(np.percentile(speed, 99)))}
+
+
+def render_movie(sources, output, fps=30, azim_step=0.5, elev=30.0, processes=None,
+                 settings=None, **kwargs):
+    """
+    Render one frame per source, rotating the camera by azim_step
+    degrees per frame, in a process pool; frames are written in order
+    as they complete. Extra keyword arguments go to frame_settings.
+    Returns the path actually written
+    """
+    if settings is None:
+        settings = frame_settings(sources[0], **kwargs)
+    tasks = [(source, k * azim_step, elev, settings) for k, source in enumerate(sources)]
+    sink, output = open_sink(output, settings['size'], fps)
+    if isinstance(sink, GifSink) and len(tasks) > sink.max_frames:
+        raise ValueError(f"{len(tasks)} frames exceed the GIF limit of {sink.max_frames} "
+                         f"at {settings['size']} px; write .mp4 or a directory")
+    try:
+        with Pool(processes) as pool:
+            for k, rgb in enumerate(pool.imap(render_frame, tasks)):
+                sink.write(rgb)
+                print(f"\rFrame {k + 1}/{len(tasks)}", end='', flush=True)
+        print()
+    finally:
+        sink.close()
+    return output
+
+
+def main():
+    """
+    Render snapshot files into a movie
+    """
+    args = sys.argv[1:]
+    if len(args) < 2:
+        print("Usage: python raster.py <output.mp4|output.gif|directory> <snapshot> [snapshot ...] [options]")
+        print("\nOptions:")
+        print("  --colour density|velocity  (default density)")
+        print("  --size PIXELS              (default 800)")
+        print("  --fps F                    (default 30)")
+        print("  --frame-dt DT              interpolate frames every DT time units")
+        sys.exit(1)
+
+    output = args[0]
+    files, options = [], {}
+    rest = iter(args[1:])
+    for arg in rest:
+        if arg.startswith('--'):
+            options[arg] = next(rest)
+        else:
+            files.append(arg)
+    sources = [('file', f) for f in files]
+    if '--frame-dt' in options:
+        times = [read_header(f)[2] for f in files]
+        sources = between_sources(sources, times, float(options['--frame-dt']))
+    written = render_movie(sources, output,
+                           fps=int(options.get('--fps', 30)),
+                           size=int(options.get('--size', DEFAULT_SIZE)),
+                           colour=options.get('--colour', 'density'))
+    print(f"Saved {written}")
+
+
+if __name__ == '__main__':
+    main()
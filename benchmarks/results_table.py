@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Results Table
+Per-snapshot analysis results of a run, keyed by snapshot file identity
+(name, size, modification time) and stamped with the analysis version,
+so analyses only recompute snapshots that are new or have changed.
+Tables are JSON files in <outputs>/analysis/.
+"""
+
+import json
+import os
+import sys
+
+import numpy as np
+
+TABLE_DIR = 'analysis'
+
+
+def file_identity(filename):
+    """Identity of a snapshot file: changes whenever the file is rewritten"""
+    stat = os.stat(filename)
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+
+def to_json(value):
+    """NumPy scalars and arrays as plain JSON values"""
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, dict):
+        return {k: to_json(v) for k, v in value.items()}
+    return value
+
+
+def column(rows, key):
+    """One value of every row as an array (NaN where missing)"""
+    return np.array([r['values'].get(key, np.nan) for r in rows], dtype=np.float64)
+
+
+class ResultsTable:
+    """
+    One table per analysis (name). Each row holds the identity of the
+    snapshot file it was computed from, its time and a dict of values.
+    A table written by another analysis version is discarded on load.
+    """
+
+    def __init__(self, outputs_dir='../outputs', name='evolution', version=1):
+        self.outputs_dir = outputs_dir
+        self.name = name
+        self.version = version
+        self.path = os.path.join(outputs_dir, TABLE_DIR, name + '.json')
+        self.rows = {}
+
+        if os.path.exists(self.path):
+            with open(self.path, 'r') as f:
+                data = json.load(f)
+            if data.get('version') == version:
+                self.rows = data['rows']
+
+    def __len__(self):
+        return len(self.rows)
+
+    def get(self, filename):
+        """Row of filename if it was computed from the file as it is now, else None"""
+        row = self.rows.get(os.path.basename(filename))
+        if row is None or row['identity'] != file_identity(filename):
+            return None
+        return row
+
+    def pending(self, files):
+        """Files with no up-to-date row"""
+        return [f for f in files if self.get(f) is None]
+
+    def put(self, filename, time, values):
+        """Store the values computed from filename (call save() to persist)"""
+        self.rows[os.path.basename(filename)] = {
+            'identity': file_identity(filename),
+            'time': float(time),
+            'values': to_json(values),
+        }
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump({'version': self.version, 'rows': self.rows}, f)
+        os.replace(tmp, self.path)
+
+    def select(self, files):
+        """Up-to-date rows of files, sorted by time (files without a row are skipped)"""
+        rows = [self.get(f) for f in files]
+        return sorted((r for r in rows if r is not None), key=lambda r: r['time'])
+
+
+def main():
+    """
+    List the results tables of an outputs directory
+    """
+    outputs_dir = sys.argv[1] if len(sys.argv) > 1 else '../outputs'
+    table_dir = os.path.join(outputs_dir, TABLE_DIR)
+    if not os.path.isdir(table_dir):
+        print(f"No results tables in {outputs_dir}")
+        return
+    for name in sorted(os.listdir(table_dir)):
+        if not name.endswith('.json'):
+            continue
+        with open(os.path.join(table_dir, name), 'r') as f:
+            data = json.load(f)
+        print(f"{name[:-len('.json')]}: version {data.get('version')}, {len(data['rows'])} snapshots")
+
+
+if __name__ == '__main__':
+    main()
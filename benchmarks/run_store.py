@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+"""
+Run Store
+Consolidates every snapshot of a run into one memory-mapped
+(n_snap, N, 6) array of positions and velocities, rows ordered by
+particle id, plus a time index for random access by time
+"""
+
+import glob
+import json
+import os
+import sys
+
+import numpy as np
+
+from snapshot_stream import stream_snapshots
+
+STORE_DIR = 'run_store'
+SNAPSHOT_PATTERN = '[0-9][0-9][0-9][0-9].dat'
+
+# Column order of the last axis of RunStore.states
+STATE_COLUMNS = ('x', 'y', 'z', 'vx', 'vy', 'vz')
+
+
+class RunStore:
+    """
+    Appendable store for one run
+
+    Layout of the store directory:
+      meta.json   - nbody, times, disksteps and source file identities
+      ids.npy     - sorted particle ids (row order of every snapshot)
+      mass.npy    - particle masses in the same order
+      states.f8   - raw float64 array of shape (n_snap, nbody, 6)
+    """
+
+    def __init__(self, outputs_dir='../outputs', path=None):
+        self.outputs_dir = outputs_dir
+        self.path = path or os.path.join(outputs_dir, STORE_DIR)
+        self.meta = {'nbody': None, 'times': [], 'disksteps': [], 'sources': []}
+        self.ids = None
+        self.mass = None
+        self._states = None
+        # (file, reason) of the snapshots the last sync could not append
+        self.skipped = []
+
+        meta_file = os.path.join(self.path, 'meta.json')
+        if os.path.exists(meta_file):
+            with open(meta_file, 'r') as f:
+                self.meta = json.load(f)
+            self.ids = np.load(os.path.join(self.path, 'ids.npy'))
+            self.mass = np.load(os.path.join(self.path, 'mass.npy'))
+
+    def __len__(self):
+        return len(self.meta['times'])
+
+    @property
+    def nbody(self):
+        return self.meta['nbody']
+
+    @property
+    def times(self):
+        return np.array(self.meta['times'])
+
+    @property
+    def states(self):
+        """Read-only memmap of shape (n_snap, nbody, 6)"""
+        if self._states is None and len(self) > 0:
+            self._states = np.memmap(self._states_file(), dtype=np.float64, mode='r',
+                                     shape=(len(self), self.nbody, len(STATE_COLUMNS)))
+        return self._states
+
+    def _states_file(self):
+        return os.path.join(self.path, 'states.f8')
+
+    def _save_meta(self):
+        tmp = os.path.join(self.path, 'meta.json.tmp')
+        with open(tmp, 'w') as f:
+            json.dump(self.meta, f)
+        os.replace(tmp, os.path.join(self.path, 'meta.json'))
+
+    def append(self, diskstep, time, particles, source=None):
+        """
+        Append one snapshot (structured array with id, mass, pos, vel)
+        Snapshots must arrive in increasing time and hold the same ids.
+        """
+        order = np.argsort(particles['id'], kind='stable')
+        particles = particles[order]
+
+        if self.nbody is None:
+            os.makedirs(self.path, exist_ok=True)
+            self.meta['nbody'] = len(particles)
+            self.ids = particles['id'].copy()
+            self.mass = particles['mass'].copy()
+            np.save(os.path.join(self.path, 'ids.npy'), self.ids)
+            np.save(os.path.join(self.path, 'mass.npy'), self.mass)
+        elif len(particles) != self.nbody or not np.array_equal(particles['id'], self.ids):
+            raise ValueError(f"Particle set differs from the store ({len(particles)} vs {self.nbody})")
+
+        if len(self) and time <= self.meta['times'][-1]:
+            raise ValueError(f"Snapshot t={time} is not after the last stored t={self.meta['times'][-1]}")
+
+        rows = np.empty((self.nbody, len(STATE_COLUMNS)), dtype=np.float64)
+        rows[:, 0:3] = particles['pos']
+        rows[:, 3:6] = particles['vel']
+
+        row_bytes = rows.nbytes
+        with open(self._states_file(), 'ab') as f:
+            # Drop any partial write left by an interrupted append;
+            # meta.json is only updated once the data is on disk.
+            f.truncate(len(self) * row_bytes)
+            f.write(rows.tobytes())
+
+        self.meta['times'].append(float(time))
+        self.meta['disksteps'].append(int(diskstep))
+        self.meta['sources'].append(source)
+        self._save_meta()
+        self._states = None
+
+    def reset(self):
+        """Delete the stored data (the next sync rebuilds it from scratch)"""
+        for name in ('meta.json', 'ids.npy', 'mass.npy', 'states.f8'):
+            path = os.path.join(self.path, name)
+            if os.path.exists(path):
+                os.remove(path)
+        self.meta = {'nbody': None, 'times': [], 'disksteps': [], 'sources': []}
+        self.ids = None
+        self.mass = None
+        self._states = None
+
+    def stale_sources(self):
+        """Stored source files that are missing or changed since they were appended"""
+        stale = []
+        for source in self.meta['sources']:
+            if not source:
+                continue
+            try:
+                stat = os.stat(os.path.join(self.outputs_dir, source['file']))
+            except FileNotFoundError:
+                stale.append(source['file'])
+                continue
+            if stat.st_size != source['size'] or stat.st_mtime != source['mtime']:
+                stale.append(source['file'])
+        return stale
+
+    def sync(self, pattern=SNAPSHOT_PATTERN, rebuild=True):
+        """
+        Append snapshot files of outputs_dir not yet in the store
+        If a stored snapshot was rewritten or removed (e.g. a new run in
+        the same directory), the store is rebuilt from scratch, or with
+        rebuild=False a ValueError is raised.
+        Snapshots that cannot be appended (incomplete, a different
+        particle set, or a time not after the last stored one, as in a
+        restart dump) are skipped and listed in self.skipped.
+        Returns the number of snapshots added
+        """
+        self.skipped = []
+        stale = self.stale_sources()
+        if stale:
+            if not rebuild:
+                raise ValueError(f"Outputs changed since the store was built ({', '.join(stale[:3])}"
+                                 f"{', ...' if len(stale) > 3 else ''}); rebuild it")
+            self.reset()
+
+        def skip(filename, error):
+            name = os.path.basename(filename)
+            print(f"Skipping {name}: {error}")
+            self.skipped.append((name, str(error)))
+
+        known = {s['file'] for s in self.meta['sources'] if s}
+        files = [f for f in sorted(glob.glob(os.path.join(self.outputs_dir, pattern)))
+                 if os.path.basename(f) not in known]
+        added = 0
+        # The next snapshots are parsed while the current one is written out
+        for filename, diskstep, nbody, time, particles in stream_snapshots(files, on_error=skip):
+            stat = os.stat(filename)
+            try:
+                self.append(diskstep, time, particles,
+                            source={'file': os.path.basename(filename), 'size': stat.st_size,
+                                    'mtime': stat.st_mtime})
+            except ValueError as e:
+                skip(filename, e)
+                continue
+            added += 1
+        return added
+
+    def index_at(self, time):
+        """Index of the stored snapshot closest to time"""
+        times = self.times
+        i = np.searchsorted(times, time)
+        if i == 0:
+            return 0
+        if i == len(times):
+            return len(times) - 1
+        return i if times[i] - time < time - times[i - 1] else i - 1
+
+    def at_time(self, time):
+        """(nbody, 6) view of the snapshot closest to time"""
+        return self.states[self.index_at(time)]
+
+    def rows_of(self, ids):
+        """Row positions of the given particle ids"""
+        ids = np.asarray(ids)
+        rows = np.searchsorted(self.ids, ids)
+        if np.any(rows >= self.nbody) or np.any(self.ids[np.minimum(rows, self.nbody - 1)] != ids):
+            raise KeyError("Unknown particle id")
+        return rows
+
+    def trajectory(self, ids):
+        """(n_snap, k, 6) positions and velocities of the given particle ids"""
+        return self.states[:, self.rows_of(ids), :]
+
+
+def main():
+    """
+    Build or update the store of an outputs directory
+    """
+    outputs_dir = sys.argv[1] if len(sys.argv) > 1 else '../outputs'
+    store = RunStore(outputs_dir)
+    stale = store.stale_sources()
+    if stale:
+        print(f"{len(stale)} stored snapshots changed on disk; rebuilding {store.path}")
+    added = store.sync()
+    print(f"Added {added} snapshots to {store.path}")
+    if len(store):
+        print(f"Store: {len(store)} snapshots, N={store.nbody}, "
+              f"t={store.times[0]:.3f} .. {store.times[-1]:.3f}")
+
+
+if __name__ == '__main__':
+    main()
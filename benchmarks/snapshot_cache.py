@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+Snapshot Cache
+On-disk cache of parsed text snapshots, keyed by (path, size, mtime,
+format version), with LRU eviction under a size budget.
+Used transparently by snapshot_io.read_snapshot.
+
+Environment:
+  NBODY_CACHE_DIR  cache directory (default ~/.cache/nbody-snapshots)
+  NBODY_CACHE_MB   size budget in MB (default 2048)
+  NBODY_CACHE=0    disable the cache
+"""
+
+import hashlib
+import json
+import os
+import sys
+import uuid
+
+import numpy as np
+
+# Bump when the parsed representation changes to invalidate old entries
+FORMAT_VERSION = 1
+
+CACHE_DIR = os.environ.get('NBODY_CACHE_DIR',
+                           os.path.join(os.path.expanduser('~'), '.cache', 'nbody-snapshots'))
+CACHE_BYTES = int(float(os.environ.get('NBODY_CACHE_MB', 2048)) * 1024 * 1024)
+ENABLED = os.environ.get('NBODY_CACHE', '1') != '0'
+
+
+def cache_key(filename):
+    """Key of the current contents of filename (changes when it is rewritten)"""
+    stat = os.stat(filename)
+    ident = f"{os.path.abspath(filename)}|{stat.st_size}|{stat.st_mtime_ns}|{FORMAT_VERSION}"
+    return hashlib.sha1(ident.encode()).hexdigest()
+
+
+def _paths(key):
+    return os.path.join(CACHE_DIR, key + '.npy'), os.path.join(CACHE_DIR, key + '.json')
+
+
+def load(filename):
+    """
+    Cached (diskstep, nbody, time, particles) for filename, or None
+    particles is a read-only memmap of the full structured array.
+    """
+    if not ENABLED:
+        return None
+    data_path, header_path = _paths(cache_key(filename))
+    try:
+        with open(header_path, 'r') as f:
+            header = json.load(f)
+        particles = np.load(data_path, mmap_mode='r')
+        # Refresh the access time used for LRU eviction
+        os.utime(header_path)
+    except (OSError, ValueError):
+        return None
+    return header['diskstep'], header['nbody'], header['time'], particles
+
+
+def store(filename, diskstep, nbody, time, particles):
+    """Add a parsed snapshot to the cache; failures are ignored"""
+    if not ENABLED:
+        return
+    data_path, header_path = _paths(cache_key(filename))
+    # Temporary names unique to this writer: pool workers may cache the
+    # same snapshot at once, and each must only publish its own complete files
+    tag = f'{os.getpid()}.{uuid.uuid4().hex}'
+    data_tmp, header_tmp = f'{data_path}.{tag}.tmp.npy', f'{header_path}.{tag}.tmp'
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        np.save(data_tmp, particles)
+        os.replace(data_tmp, data_path)
+        # The header is written last: an entry only counts once it exists
+        with open(header_tmp, 'w') as f:
+            json.dump({'file': os.path.abspath(filename), 'diskstep': diskstep,
+                       'nbody': nbody, 'time': time}, f)
+        os.replace(header_tmp, header_path)
+        evict()
+    except OSError:
+        for tmp in (data_tmp, header_tmp):
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+
+
+def entries():
+    """(access time, bytes, key) of every cache entry, oldest first"""
+    if not os.path.isdir(CACHE_DIR):
+        return []
+    result = []
+    for name in os.listdir(CACHE_DIR):
+        if not name.endswith('.json'):
+            continue
+        key = name[:-len('.json')]
+        data_path, header_path = _paths(key)
+        try:
+            size = os.path.getsize(data_path) + os.path.getsize(header_path)
+            result.append((os.path.getmtime(header_path), size, key))
+        except OSError:
+            continue
+    return sorted(result)
+
+
+def evict(budget=None):
+    """Remove least recently used entries until the cache fits the budget"""
+    budget = CACHE_BYTES if budget is None else budget
+    current = entries()
+    total = sum(size for _, size, _ in current)
+    for _, size, key in current:
+        if total <= budget:
+            break
+        for path in _paths(key):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        total -= size
+
+
+def main():
+    """
+    Show or clear the snapshot cache
+    """
+    command = sys.argv[1] if len(sys.argv) > 1 else 'info'
+    if command == 'clear':
+        evict(budget=0)
+        print(f"Cleared {CACHE_DIR}")
+    elif command == 'info':
+        current = entries()
+        total = sum(size for _, size, _ in current)
+        print(f"Cache: {CACHE_DIR}")
+        print(f"Entries: {len(current)}, {total / 1e6:.1f} MB of {CACHE_BYTES / 1e6:.0f} MB")
+    else:
+        print("Usage: python snapshot_cache.py [info|clear]")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
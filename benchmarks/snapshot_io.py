@@ -0,0 +1,275 @@
+#!/usr/bin/env python3
+"""
+Snapshot I/O for phi-GPU outputs
+Bulk reader for the NNNN.dat / data.con / *.inp text format and
+the binary columnar .nbs format (see convert_snapshots.py)
+"""
+
+import os
+import struct
+
+import numpy as np
+
+import snapshot_cache
+
+# Layout written by outputsnap() in phi-GPU.cpp:
+#   diskstep
+#   nbody
+#   time
+#   id  mass  x y z  vx vy vz      (nbody rows)
+HEADER_LINES = 3
+
+SNAPSHOT_DTYPE = np.dtype([
+    ('id', np.int64),
+    ('mass', np.float64),
+    ('pos', np.float64, (3,)),
+    ('vel', np.float64, (3,)),
+])
+
+# Text columns occupied by each field of SNAPSHOT_DTYPE
+FIELD_COLUMNS = {
+    'id': [0],
+    'mass': [1],
+    'pos': [2, 3, 4],
+    'vel': [5, 6, 7],
+}
+
+# Binary columnar layout (.nbs):
+#   64-byte header: magic, diskstep (int64), nbody (int64), time (float64)
+#   followed by one contiguous little-endian array of nbody values per column
+BINARY_MAGIC = b'NBSNAP01'
+BINARY_HEADER = struct.Struct('<8sqqd32x')
+BINARY_COLUMNS = ('id', 'mass', 'x', 'y', 'z', 'vx', 'vy', 'vz')
+BINARY_SUFFIX = '.nbs'
+
+# Binary columns backing each field of SNAPSHOT_DTYPE
+FIELD_BINARY_COLUMNS = {
+    'id': ['id'],
+    'mass': ['mass'],
+    'pos': ['x', 'y', 'z'],
+    'vel': ['vx', 'vy', 'vz'],
+}
+
+
+def snapshot_dtype(columns=None):
+    """Structured dtype restricted to the requested fields (all by default)"""
+    if columns is None:
+        return SNAPSHOT_DTYPE
+    unknown = [c for c in columns if c not in FIELD_COLUMNS]
+    if unknown:
+        raise ValueError(f"Unknown snapshot columns: {unknown}")
+    return np.dtype([(name, SNAPSHOT_DTYPE.fields[name][0])
+                     for name in SNAPSHOT_DTYPE.names if name in columns])
+
+
+def is_binary(filename):
+    """True if filename starts with the .nbs magic"""
+    with open(filename, 'rb') as f:
+        return f.read(len(BINARY_MAGIC)) == BINARY_MAGIC
+
+
+def read_header(filename):
+    """
+    Read only the header of a snapshot (text or binary)
+    Returns: diskstep, nbody, time
+    """
+    if is_binary(filename):
+        with open(filename, 'rb') as f:
+            _, diskstep, nbody, time = BINARY_HEADER.unpack(f.read(BINARY_HEADER.size))
+        return diskstep, nbody, time
+    with open(filename, 'r') as f:
+        diskstep = int(f.readline())
+        nbody = int(f.readline())
+        time = float(f.readline())
+    return diskstep, nbody, time
+
+
+def read_snapshot(filename, columns=None, cache=True):
+    """
+    Read a snapshot file (.dat / .con / .inp text format or .nbs binary)
+
+    columns selects a subset of the fields 'id', 'mass', 'pos', 'vel';
+    unselected binary columns are never read from disk.
+
+    Parsed text snapshots go through snapshot_cache, so reading the same
+    unchanged file again (from any tool) skips the text parser.
+
+    Returns: diskstep, nbody, time, particles (structured array)
+    Raises ValueError if the particle block does not hold nbody rows.
+    """
+    dtype = snapshot_dtype(columns)
+    if is_binary(filename):
+        diskstep, nbody, time, cols = open_binary(filename)
+        particles = np.empty(nbody, dtype=dtype)
+        for name in dtype.names:
+            names = FIELD_BINARY_COLUMNS[name]
+            if len(names) == 1:
+                particles[name] = cols[names[0]]
+            else:
+                for k, c in enumerate(names):
+                    particles[name][:, k] = cols[c]
+        return diskstep, nbody, time, particles
+
+    if not cache:
+        return parse_text(filename, dtype)
+
+    # The cache holds every field so that all column selections share one entry
+    cached = snapshot_cache.load(filename)
+    if cached is None:
+        cached = parse_text(filename, SNAPSHOT_DTYPE)
+        snapshot_cache.store(filename, *cached)
+    diskstep, nbody, time, full = cached
+
+    particles = np.empty(nbody, dtype=dtype)
+    for name in dtype.names:
+        particles[name] = full[name]
+    return diskstep, nbody, time, particles
+
+
+def read_rows(filename, rows, columns=None):
+    """
+    Read only the given rows (array positions) of a snapshot
+
+    Binary snapshots are indexed through their memmap; text snapshots
+    through their snapshot_cache entry (parsed once on a miss), so only
+    the pages holding the requested rows are touched.
+
+    Returns: diskstep, nbody, time, particles (structured array, len(rows))
+    """
+    dtype = snapshot_dtype(columns)
+    rows = np.asarray(rows, dtype=np.int64)
+    if is_binary(filename):
+        diskstep, nbody, time, cols = open_binary(filename)
+        particles = np.empty(len(rows), dtype=dtype)
+        for name in dtype.names:
+            names = FIELD_BINARY_COLUMNS[name]
+            if len(names) == 1:
+                particles[name] = cols[names[0]][rows]
+            else:
+                for k, c in enumerate(names):
+                    particles[name][:, k] = cols[c][rows]
+        return diskstep, nbody, time, particles
+
+    cached = snapshot_cache.load(filename)
+    if cached is None:
+        read_snapshot(filename, columns=('id',))
+        cached = snapshot_cache.load(filename)
+    if cached is None:
+        # Cache disabled or not writable: fall back to a full parse
+        cached = parse_text(filename, SNAPSHOT_DTYPE)
+    diskstep, nbody, time, full = cached
+
+    selected = full[rows]
+    particles = np.empty(len(rows), dtype=dtype)
+    for name in dtype.names:
+        particles[name] = selected[name]
+    return diskstep, nbody, time, particles
+
+
+def parse_text(filename, dtype=SNAPSHOT_DTYPE):
+    """
+    Parse a text snapshot into a structured array of the given dtype;
+    text columns of fields not in dtype are skipped by the parser
+    """
+    usecols = [c for name in dtype.names for c in FIELD_COLUMNS[name]]
+
+    with open(filename, 'r') as f:
+        diskstep = int(f.readline())
+        nbody = int(f.readline())
+        time = float(f.readline())
+        # np.loadtxt parses the whole block in C; max_rows stops at nbody
+        # so trailing garbage after a complete snapshot is ignored.
+        block = np.loadtxt(f, dtype=np.float64, usecols=usecols,
+                           max_rows=nbody, ndmin=2)
+
+    if block.shape[0] != nbody:
+        raise ValueError(f"{filename}: incomplete data "
+                         f"({block.shape[0]} rows vs nbody={nbody})")
+
+    particles = np.empty(nbody, dtype=dtype)
+    col = 0
+    for name in dtype.names:
+        width = len(FIELD_COLUMNS[name])
+        if width == 1:
+            particles[name] = block[:, col]
+        else:
+            particles[name] = block[:, col:col + width]
+        col += width
+
+    return diskstep, nbody, time, particles
+
+
+def open_binary(filename):
+    """
+    Memory-map a binary .nbs snapshot without reading the particle data
+
+    Returns: diskstep, nbody, time, columns
+    columns maps 'id', 'mass', 'x', 'y', 'z', 'vx', 'vy', 'vz' to read-only
+    memmap views; only the pages of the columns actually touched are read.
+    """
+    with open(filename, 'rb') as f:
+        magic, diskstep, nbody, time = BINARY_HEADER.unpack(f.read(BINARY_HEADER.size))
+    if magic != BINARY_MAGIC:
+        raise ValueError(f"{filename}: not a binary snapshot")
+
+    expected = BINARY_HEADER.size + len(BINARY_COLUMNS) * nbody * 8
+    size = os.path.getsize(filename)
+    if size < expected:
+        raise ValueError(f"{filename}: incomplete data ({size} bytes vs {expected})")
+
+    data = np.memmap(filename, dtype='<f8', mode='r', offset=BINARY_HEADER.size,
+                     shape=(len(BINARY_COLUMNS), nbody))
+    columns = {name: data[k] for k, name in enumerate(BINARY_COLUMNS)}
+    columns['id'] = columns['id'].view('<i8')
+    return diskstep, nbody, time, columns
+
+
+def write_binary(filename, diskstep, time, particles):
+    """Write a structured particle array (all four fields) as a .nbs snapshot"""
+    with BinaryWriter(filename, diskstep, len(particles), time) as writer:
+        writer.write_rows(0, particle_columns(particles))
+
+
+def particle_columns(particles):
+    """Binary column name -> 1D array view of a structured particle array"""
+    columns = {}
+    for name in SNAPSHOT_DTYPE.names:
+        names = FIELD_BINARY_COLUMNS[name]
+        if len(names) == 1:
+            columns[names[0]] = particles[name]
+        else:
+            for k, c in enumerate(names):
+                columns[c] = particles[name][:, k]
+    return columns
+
+
+class BinaryWriter:
+    """
+    Writes a .nbs snapshot in row chunks without holding all particles
+    The file is preallocated and each chunk lands in every column.
+    """
+
+    def __init__(self, filename, diskstep, nbody, time):
+        self.nbody = nbody
+        self.f = open(filename, 'wb')
+        self.f.write(BINARY_HEADER.pack(BINARY_MAGIC, diskstep, nbody, time))
+        self.f.truncate(BINARY_HEADER.size + len(BINARY_COLUMNS) * nbody * 8)
+
+    def write_rows(self, start, columns):
+        """Write rows start.. of each column in columns (name -> 1D array)"""
+        for k, name in enumerate(BINARY_COLUMNS):
+            dtype = '<i8' if name == 'id' else '<f8'
+            values = np.ascontiguousarray(columns[name], dtype=dtype)
+            if start + len(values) > self.nbody:
+                raise ValueError(f"Rows {start}..{start + len(values)} exceed nbody={self.nbody}")
+            self.f.seek(BINARY_HEADER.size + (k * self.nbody + start) * 8)
+            self.f.write(values.tobytes())
+
+    def close(self):
+        self.f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Snapshot Stream
+Generator over snapshot files with a bounded read-ahead queue filled
+by a thread pool, so parsing the next snapshots overlaps with whatever
+the consumer does with the current one
+"""
+
+import glob
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from snapshot_io import read_header, read_snapshot
+
+SNAPSHOT_GLOB = '../outputs/[0-9][0-9][0-9][0-9].dat'
+
+
+def select_snapshots(files, t_min=None, t_max=None, stride=1):
+    """
+    Filter snapshot files by time range (read from the headers only),
+    then keep every stride-th of the remaining ones
+    """
+    if t_min is not None or t_max is not None:
+        selected = []
+        for filename in files:
+            time = read_header(filename)[2]
+            if t_min is not None and time < t_min:
+                continue
+            if t_max is not None and time > t_max:
+                continue
+            selected.append(filename)
+        files = selected
+    return list(files)[::stride]
+
+
+def stream_snapshots(files=None, columns=None, t_min=None, t_max=None, stride=1,
+                     prefetch=4, workers=2, on_error=None):
+    """
+    Yield (filename, diskstep, nbody, time, particles) in file order
+
+    At most prefetch snapshots are parsed ahead of the consumer, so
+    memory stays bounded regardless of the length of the run.
+    With on_error, a snapshot that fails to read (ValueError, e.g. an
+    incomplete file) is passed to on_error(filename, error) and skipped
+    instead of ending the stream.
+    """
+    if files is None:
+        files = sorted(glob.glob(SNAPSHOT_GLOB))
+    files = select_snapshots(files, t_min=t_min, t_max=t_max, stride=stride)
+
+    executor = ThreadPoolExecutor(max_workers=workers)
+    pending = deque()
+    queue = iter(files)
+    try:
+        for filename in queue:
+            pending.append((filename, executor.submit(read_snapshot, filename, columns)))
+            if len(pending) >= prefetch:
+                break
+
+        while pending:
+            filename, future = pending.popleft()
+            # Refill before yielding so the workers run while the consumer does
+            for next_file in queue:
+                pending.append((next_file, executor.submit(read_snapshot, next_file, columns)))
+                break
+            try:
+                result = future.result()
+            except ValueError as e:
+                if on_error is None:
+                    raise
+                on_error(filename, e)
+                continue
+            yield (filename,) + result
+    finally:
+        # Consumer stopped early (break / close): drop queued reads
+        executor.shutdown(wait=False, cancel_futures=True)
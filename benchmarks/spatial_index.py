@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+"""
+Spatial Index
+Morton-ordered octree of a snapshot, built once and saved next to it:
+  NNNN.dat.oct.npz   node arrays (particle ranges, levels, children,
+                     bounding boxes) and the identity of the source file
+  NNNN.dat.oct.nbs   the particles rewritten in Morton order (.nbs format)
+Box, sphere and k-nearest queries walk the small node arrays and then
+read only the matching contiguous ranges of the memory-mapped .nbs
+file, so a zoom into the core touches a small fraction of the data.
+"""
+
+import os
+import sys
+
+import numpy as np
+
+from cluster_analysis import shrinking_sphere_centre
+from octree import Octree, ranges_to_indices
+from results_table import file_identity
+from snapshot_io import (FIELD_BINARY_COLUMNS, open_binary, read_snapshot, snapshot_dtype,
+                         write_binary)
+
+INDEX_SUFFIX = '.oct.npz'
+DATA_SUFFIX = '.oct.nbs'
+
+# Larger leaves than for Barnes-Hut: fewer nodes, longer contiguous reads
+INDEX_LEAF_SIZE = 64
+
+NODE_ARRAYS = ('start', 'end', 'level', 'first_child', 'n_child', 'bbox_lo', 'bbox_hi')
+
+
+def index_paths(filename):
+    return filename + INDEX_SUFFIX, filename + DATA_SUFFIX
+
+
+def build_index(filename, leaf_size=INDEX_LEAF_SIZE, force=False):
+    """
+    Build the index of a snapshot unless an up-to-date one exists
+    Returns True if it was (re)built
+    """
+    index_file, data_file = index_paths(filename)
+    identity = file_identity(filename)
+    if not force and os.path.exists(index_file) and os.path.exists(data_file):
+        with np.load(index_file) as data:
+            if (int(data['source_size']) == identity['size']
+                    and int(data['source_mtime_ns']) == identity['mtime_ns']):
+                return False
+
+    diskstep, nbody, time, particles = read_snapshot(filename)
+    tree = Octree(particles['pos'], leaf_size=leaf_size)
+    centre = shrinking_sphere_centre(particles['pos'], particles['mass'])
+
+    # Data first, index last: an index only exists once its data does
+    tmp = data_file + '.tmp'
+    write_binary(tmp, diskstep, time, particles[tree.order])
+    os.replace(tmp, data_file)
+    tmp = index_file + '.tmp.npz'
+    np.savez(tmp, lo=tree.lo, size=tree.size, centre=centre,
+             source_size=identity['size'], source_mtime_ns=identity['mtime_ns'],
+             **{name: getattr(tree, name) for name in NODE_ARRAYS})
+    os.replace(tmp, index_file)
+    return True
+
+
+def merge_ranges(starts, ends):
+    """Sort ranges and merge the ones that touch"""
+    if not len(starts):
+        return starts, ends
+    order = np.argsort(starts)
+    starts, ends = starts[order], ends[order]
+    new = np.ones(len(starts), dtype=bool)
+    new[1:] = starts[1:] > np.maximum.accumulate(ends)[:-1]
+    return starts[new], np.maximum.reduceat(ends, np.flatnonzero(new))
+
+
+class SpatialIndex:
+    """Query interface of the index of one snapshot (see build_index)"""
+
+    def __init__(self, filename, build=True):
+        if build:
+            build_index(filename)
+        index_file, data_file = index_paths(filename)
+        identity = file_identity(filename)
+        with np.load(index_file) as data:
+            if (int(data['source_size']) != identity['size']
+                    or int(data['source_mtime_ns']) != identity['mtime_ns']):
+                raise ValueError(f"{index_file} is out of date; rebuild it")
+            for name in NODE_ARRAYS:
+                setattr(self, name, data[name])
+            self.centre = data['centre']
+        self.filename = filename
+        self.diskstep, self.nbody, self.time, self.columns = open_binary(data_file)
+
+    def __len__(self):
+        return len(self.start)
+
+    def _walk(self, classify):
+        """
+        Particle ranges of the nodes selected by classify(nodes), which
+        returns (inside, overlap) masks: inside nodes are taken whole,
+        overlapping leaves are returned for exact filtering
+        Returns: (starts, ends) taken whole, (starts, ends) to filter
+        """
+        whole, partial = [], []
+        nodes = np.zeros(1, dtype=np.int64)
+        while len(nodes):
+            inside, overlap = classify(nodes)
+            whole.append(nodes[inside])
+            open_ = overlap & ~inside
+            leaf = self.n_child[nodes] == 0
+            partial.append(nodes[open_ & leaf])
+            parents = nodes[open_ & ~leaf]
+            nodes = ranges_to_indices(self.first_child[parents],
+                                      self.first_child[parents] + self.n_child[parents])
+        whole, partial = np.concatenate(whole), np.concatenate(partial)
+        return (merge_ranges(self.start[whole], self.end[whole]),
+                merge_ranges(self.start[partial], self.end[partial]))
+
+    def read_ranges(self, starts, ends, columns=None):
+        """Particles of the given Morton-order ranges (structured array)"""
+        rows = ranges_to_indices(starts, ends)
+        dtype = snapshot_dtype(columns)
+        particles = np.empty(len(rows), dtype=dtype)
+        for name in dtype.names:
+            names = FIELD_BINARY_COLUMNS[name]
+            if len(names) == 1:
+                particles[name] = self.columns[names[0]][rows]
+            else:
+                for k, c in enumerate(names):
+                    particles[name][:, k] = self.columns[c][rows]
+        return particles
+
+    def _positions(self, starts, ends):
+        rows = ranges_to_indices(starts, ends)
+        return np.column_stack([self.columns[c][rows] for c in ('x', 'y', 'z')])
+
+    def _query(self, classify, select, columns):
+        (w_start, w_end), (p_start, p_end) = self._walk(classify)
+        whole = self.read_ranges(w_start, w_end, columns)
+        keep = select(self._positions(p_start, p_end))
+        partial = self.read_ranges(p_start, p_end, columns)[keep]
+        return np.concatenate([whole, partial])
+
+    def box(self, lo, hi, columns=None):
+        """Particles with lo <= pos <= hi (componentwise)"""
+        lo, hi = np.asarray(lo, dtype=np.float64), np.asarray(hi, dtype=np.float64)
+
+        def classify(nodes):
+            b_lo, b_hi = self.bbox_lo[nodes], self.bbox_hi[nodes]
+            inside = np.all((b_lo >= lo) & (b_hi <= hi), axis=1)
+            overlap = np.all((b_hi >= lo) & (b_lo <= hi), axis=1)
+            return inside, overlap
+
+        return self._query(classify, lambda pos: np.all((pos >= lo) & (pos <= hi), axis=1), columns)
+
+    def sphere(self, centre, radius, columns=None):
+        """Particles within radius of centre"""
+        centre = np.asarray(centre, dtype=np.float64)
+
+        def classify(nodes):
+            b_lo, b_hi = self.bbox_lo[nodes], self.bbox_hi[nodes]
+            near = np.maximum(np.maximum(b_lo - centre, centre - b_hi), 0.0)
+            far = np.maximum(np.abs(b_lo - centre), np.abs(b_hi - centre))
+            inside = np.sum(far**2, axis=1) <= radius**2
+            overlap = np.sum(near**2, axis=1) <= radius**2
+            return inside, overlap
+
+        return self._query(classify, lambda pos: np.sum((pos - centre)**2, axis=1) <= radius**2,
+                           columns)
+
+    def nearest(self, point, k, columns=None):
+        """
+        The k particles nearest to point, closest first
+        The search sphere is the smallest one enclosing the deepest node
+        on the way to point that still holds k particles.
+        Returns: particles, distances
+        """
+        point = np.asarray(point, dtype=np.float64)
+        k = min(k, self.nbody)
+        node = 0
+        while self.n_child[node]:
+            kids = np.arange(self.first_child[node], self.first_child[node] + self.n_child[node])
+            # Child whose box is closest to the point
+            gap = np.maximum(np.maximum(self.bbox_lo[kids] - point, point - self.bbox_hi[kids]), 0.0)
+            best = kids[np.argmin(np.sum(gap**2, axis=1))]
+            if self.end[best] - self.start[best] < k:
+                break
+            node = best
+        far = np.maximum(np.abs(self.bbox_lo[node] - point), np.abs(self.bbox_hi[node] - point))
+        radius = np.sqrt(np.sum(far**2))
+
+        columns = None if columns is None else tuple(set(columns) | {'pos'})
+        found = self.sphere(point, radius, columns)
+        dist = np.sqrt(np.sum((found['pos'] - point)**2, axis=1))
+        order = np.argsort(dist)[:k]
+        return found[order], dist[order]
+
+
+def main():
+    """
+    Build the spatial index of snapshots, or query one
+    """
+    args = sys.argv[1:]
+    if not args:
+        print("Usage: python spatial_index.py build <snapshot> [snapshot ...] [--force]")
+        print("       python spatial_index.py sphere <snapshot> <radius> [x y z]")
+        print("       python spatial_index.py box <snapshot> <x0 y0 z0 x1 y1 z1>")
+        print("       python spatial_index.py nearest <snapshot> <k> <x y z>")
+        sys.exit(1)
+
+    command = args[0]
+    if command == 'build':
+        force = '--force' in args
+        for filename in [a for a in args[1:] if a != '--force']:
+            built = build_index(filename, force=force)
+            print(f"{filename}: {'built' if built else 'up to date'}")
+        return
+
+    index = SpatialIndex(args[1])
+    values = [float(x) for x in args[2:]]
+    if command == 'sphere':
+        centre = values[1:4] if len(values) >= 4 else index.centre
+        found = index.sphere(centre, values[0])
+    elif command == 'box':
+        found = index.box(values[0:3], values[3:6])
+    elif command == 'nearest':
+        found, dist = index.nearest(values[1:4], int(values[0]))
+        print(f"Distance to the {len(found)}th neighbour: {dist[-1]:.6f}")
+    else:
+        print(f"Unknown command: {command}")
+        sys.exit(1)
+    print(f"{args[1]}: {len(found)} of {index.nbody} particles "
+          f"({len(found) / index.nbody * 100:.2f}%), {len(index)} nodes")
+
+
+if __name__ == '__main__':
+    main()
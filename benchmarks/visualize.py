@@ -8,51 +8,58 @@ import numpy as np
 import matplotlib.pyplot as plt
 from mpl_toolkits.mplot3d import Axes3D
 import glob
+import os
 import sys
+from multiprocessing import Pool
 
-def read_snapshot(filename):
-    """
-    Read a snapshot file (.dat format)
-    Returns: snapshot_id, n_particles, time, particle_data
-    """
-    with open(filename, 'r') as f:
-        lines = f.readlines()
-
-    snapshot_id = int(lines[0].strip())
-    n_particles = int(lines[1].strip())
-    time = float(lines[2].strip())
-
-    # Read particle data: id, mass, x, y, z, vx, vy, vz
-    particles = []
-    for i in range(3, len(lines)):
-        data = lines[i].split()
-        if len(data) >= 8:
-            particles.append([
-                int(data[0]),      # id
-                float(data[1]),    # mass
-                float(data[2]),    # x
-                float(data[3]),    # y
-                float(data[4]),    # z
-                float(data[5]),    # vx
-                float(data[6]),    # vy
-                float(data[7])     # vz
-            ])
-
-    return snapshot_id, n_particles, time, np.array(particles)
+from lod import DEFAULT_BUDGET, dropped_density, stratified_subsample
+from log_follow import CONTR_COLUMNS, LogFollower
+from snapshot_io import read_snapshot
+from snapshot_stream import select_snapshots
+from spatial_index import SpatialIndex
 
-def plot_snapshot_3d(filename, save=False):
+def plot_snapshot_3d(filename, save=False, budget=DEFAULT_BUDGET, background=False):
     """
     Create a 3D scatter plot of particle positions
+    Above budget particles only a stratified subsample is drawn (whole
+    core, halo thinned by shell); background=True shades the projected
+    density of the dropped particles on the floor of the plot.
+    budget=None draws every particle.
+    """
+    snap_id, n_parts, time, particles = read_snapshot(filename, columns=('mass', 'pos'))
+    shade = None
+    if budget is not None and n_parts > budget:
+        kept, _ = stratified_subsample(particles['pos'], particles['mass'], budget=budget)
+        if background:
+            shade = dropped_density(particles['pos'], kept)
+        print(f"Drawing {len(kept)} of {n_parts} particles (level of detail)")
+        particles = particles[kept]
+    plot_particles_3d(snap_id, n_parts, time, particles, save=save, background=shade)
+
+def plot_zoom_3d(filename, radius, centre=None, save=False):
+    """
+    3D scatter plot of the particles within radius of centre (default:
+    the cluster centre), read through the snapshot's spatial index
+    """
+    index = SpatialIndex(filename)
+    centre = index.centre if centre is None else centre
+    particles = index.sphere(centre, radius, columns=('pos',))
+    print(f"Zoom r={radius} around ({centre[0]:.3f}, {centre[1]:.3f}, {centre[2]:.3f}): "
+          f"{len(particles)} of {index.nbody} particles")
+    plot_particles_3d(index.diskstep, len(particles), index.time, particles, save=save)
+
+def plot_particles_3d(snap_id, n_parts, time, particles, save=False, background=None):
+    """
+    3D scatter plot of an already loaded snapshot
+    background: optional (H, xedges, yedges) density drawn on the floor
     """
-    snap_id, n_parts, time, particles = read_snapshot(filename)
-
     fig = plt.figure(figsize=(12, 10))
     ax = fig.add_subplot(111, projection='3d')
 
     # Extract positions
-    x = particles[:, 2]  # x position
-    y = particles[:, 3]  # y position
-    z = particles[:, 4]  # z position
+    x = particles['pos'][:, 0]  # x position
+    y = particles['pos'][:, 1]  # y position
+    z = particles['pos'][:, 2]  # z position
 
     # Color by distance from center
     r = np.sqrt(x**2 + y**2 + z**2)
@@ -75,6 +82,14 @@ def plot_snapshot_3d(filename, save=False):
     ax.set_ylim(mid_y - max_range, mid_y + max_range)
     ax.set_zlim(mid_z - max_range, mid_z + max_range)
 
+    if background is not None:
+        H, xedges, yedges = background
+        xc = 0.5 * (xedges[1:] + xedges[:-1])
+        yc = 0.5 * (yedges[1:] + yedges[:-1])
+        X, Y = np.meshgrid(xc, yc, indexing='ij')
+        ax.contourf(X, Y, np.log10(H + 1), zdir='z', offset=mid_z - max_range,
+                    levels=12, cmap='Greys', alpha=0.5)
+
     if save:
         plt.savefig(f'../visualizations/snapshot_{snap_id:04d}.png', dpi=150, bbox_inches='tight')
         print(f"Saved ../visualizations/snapshot_{snap_id:04d}.png")
@@ -83,19 +98,26 @@ def plot_snapshot_3d(filename, save=False):
 
     plt.close()
 
-def plot_energy_conservation(filename='../outputs/contr.dat'):
+def plot_energy_conservation(filename='../outputs/contr.dat', follow=False, interval=5.0):
     """
     Plot energy conservation from contr.dat
+    With follow=True the plot keeps updating as the run appends lines
     """
+    if not os.path.exists(filename):
+        print(f"File {filename} not found")
+        return
+
     try:
-        # Read contr.dat: time, steps, interactions, E_total, E_kin, E_pot, dE, elapsed_time
-        data = np.loadtxt(filename)
+        # contr.dat: time, steps, n_act, E_pot, E_kin, E_tot, dE, rcm, vcm, mom, times
+        follower = LogFollower(filename, len(CONTR_COLUMNS))
+        follower.poll()
+        data = follower.data
 
         time = data[:, 0]
         energy_error = data[:, 6]  # dE column
 
         fig, ax = plt.subplots(figsize=(10, 6))
-        ax.plot(time, energy_error, 'b-', linewidth=2)
+        line, = ax.plot(time, energy_error, 'b-', linewidth=2)
         ax.axhline(y=0, color='r', linestyle='--', alpha=0.5)
         ax.set_xlabel('Time', fontsize=12)
         ax.set_ylabel('Energy Error ΔE', fontsize=12)
@@ -105,16 +127,99 @@ def plot_energy_conservation(filename='../outputs/contr.dat'):
         plt.tight_layout()
         plt.savefig('../visualizations/energy_conservation.png', dpi=150, bbox_inches='tight')
         print("Saved ../visualizations/energy_conservation.png")
-        plt.show()
 
-    except FileNotFoundError:
-        print(f"File {filename} not found")
+        if not follow:
+            plt.show()
+            return
+
+        print(f"Following {filename}, Ctrl-C to stop")
+        plt.ion()
+        plt.show()
+        while True:
+            plt.pause(interval)
+            rows = follower.poll()
+            if not len(rows) and not follower.restarted:
+                continue
+            # Only the appended lines were parsed; redraw the single line artist
+            data = follower.data
+            line.set_data(data[:, 0], data[:, 6])
+            ax.relim()
+            ax.autoscale_view()
+            fig.savefig('../visualizations/energy_conservation.png', dpi=150, bbox_inches='tight')
+            print(f"t={data[-1, 0]:.4f}: {len(rows)} new lines")
+
+    except KeyboardInterrupt:
+        pass
     except Exception as e:
         print(f"Error reading {filename}: {e}")
 
-def plot_all_snapshots():
+# Figure and artists of a batch rendering worker, created once per process
+_batch = {}
+
+def snapshot_extent(filename):
+    """
+    Worker, first pass of batch rendering: bounding box and largest
+    radius of one snapshot. Parsing here also fills snapshot_cache, so
+    the rendering pass that follows reads the parsed file back.
+    Returns: lo, hi, r_max
+    """
+    _, _, _, particles = read_snapshot(filename, columns=('pos',))
+    pos = particles['pos']
+    return pos.min(axis=0), pos.max(axis=0), np.sqrt(np.sum(pos**2, axis=1)).max()
+
+def combine_extents(extents):
+    """
+    One cube enclosing every snapshot and the largest radius
+    Returns: (mid, half_width), r_max
+    """
+    lo = np.min([e[0] for e in extents], axis=0)
+    hi = np.max([e[1] for e in extents], axis=0)
+    r_max = max(e[2] for e in extents)
+    return (0.5 * (lo + hi), 0.5 * (hi - lo).max()), r_max
+
+def _init_batch_worker():
+    plt.switch_backend('Agg')
+
+def _batch_figure(limits, r_max):
+    """One figure per worker, created on its first snapshot and reused for the rest"""
+    mid, half = limits
+    fig = plt.figure(figsize=(12, 10))
+    ax = fig.add_subplot(111, projection='3d')
+    scatter = ax.scatter([], [], [], c=[], cmap='viridis', s=1, alpha=0.6, vmin=0.0, vmax=r_max)
+    ax.set_xlabel('X', fontsize=12)
+    ax.set_ylabel('Y', fontsize=12)
+    ax.set_zlabel('Z', fontsize=12)
+    plt.colorbar(scatter, ax=ax, label='Distance from center')
+    ax.set_xlim(mid[0] - half, mid[0] + half)
+    ax.set_ylim(mid[1] - half, mid[1] + half)
+    ax.set_zlim(mid[2] - half, mid[2] + half)
+    title = ax.set_title('', fontsize=14)
+    _batch.update(fig=fig, scatter=scatter, title=title)
+
+def _render_batch_snapshot(task):
+    """Worker: update the reused artists with one snapshot and save it"""
+    filename, limits, r_max, budget = task
+    if 'fig' not in _batch:
+        _batch_figure(limits, r_max)
+    snap_id, n_parts, time, particles = read_snapshot(filename, columns=('mass', 'pos'))
+    if budget is not None and n_parts > budget:
+        kept, _ = stratified_subsample(particles['pos'], particles['mass'], budget=budget)
+        particles = particles[kept]
+    pos = particles['pos']
+    _batch['scatter']._offsets3d = (pos[:, 0], pos[:, 1], pos[:, 2])
+    _batch['scatter'].set_array(np.sqrt(np.sum(pos**2, axis=1)))
+    _batch['title'].set_text(f'N-Body Simulation (N={n_parts}, t={time:.3f})')
+    out = f'../visualizations/snapshot_{snap_id:04d}.png'
+    _batch['fig'].savefig(out, dpi=150, bbox_inches='tight')
+    return out
+
+def plot_all_snapshots(t_min=None, t_max=None, stride=1, processes=None, budget=DEFAULT_BUDGET):
     """
     Create plots for all snapshot files
+    Snapshots are spread over a process pool; each worker keeps one
+    figure and only updates its data. Axis limits and the colour scale
+    come from a first pass over all files in the same pool, so every
+    image shares them.
     """
     snapshot_files = sorted(glob.glob('../outputs/[0-9][0-9][0-9][0-9].dat'))
 
@@ -123,12 +228,20 @@ def plot_all_snapshots():
         return
 
     print(f"Found {len(snapshot_files)} snapshots")
+    files = select_snapshots(snapshot_files, t_min=t_min, t_max=t_max, stride=stride)
+    if not files:
+        print("No snapshots in the selected range")
+        return
 
-    for filename in snapshot_files:
-        print(f"Processing {filename}...")
-        plot_snapshot_3d(filename, save=True)
+    count = 0
+    with Pool(processes, initializer=_init_batch_worker) as pool:
+        limits, r_max = combine_extents(pool.map(snapshot_extent, files))
+        tasks = [(f, limits, r_max, budget) for f in files]
+        for out in pool.imap_unordered(_render_batch_snapshot, tasks):
+            print(f"Saved {out}")
+            count += 1
 
-    print(f"\nCreated {len(snapshot_files)} images")
+    print(f"\nCreated {count} images")
 
 def main():
     """
@@ -139,9 +252,13 @@ def main():
         print("\nUsage:")
         print("  python visualize.py <command> [options]")
         print("\nCommands:")
-        print("  snapshot <file>  - Visualize a single snapshot (e.g., 0000.dat)")
-        print("  all              - Create images for all snapshots")
-        print("  energy           - Plot energy conservation from contr.dat")
+        print("  snapshot <file> [--budget N] [--full] [--background]")
+        print("                   - Visualize a single snapshot (e.g., 0000.dat)")
+        print("  zoom <file> <radius> [x y z]")
+        print("                   - Visualize the particles around the centre (spatial index)")
+        print("  all [--stride K] [--tmin T] [--tmax T] [--workers P] [--budget N]")
+        print("                   - Create images for all snapshots")
+        print("  energy [--follow] - Plot energy conservation from contr.dat")
         print("\nExamples:")
         print("  python visualize.py snapshot 0000.dat")
         print("  python visualize.py all")
@@ -156,17 +273,37 @@ def main():
             print("Example: python visualize.py snapshot 0000.dat")
             sys.exit(1)
         filename = sys.argv[2]
-        plot_snapshot_3d(filename, save=False)
+        budget = DEFAULT_BUDGET
+        if '--budget' in sys.argv[3:]:
+            budget = int(sys.argv[sys.argv.index('--budget') + 1])
+        if '--full' in sys.argv[3:]:
+            budget = None
+        plot_snapshot_3d(filename, save=False, budget=budget,
+                         background='--background' in sys.argv[3:])
+
+    elif command == 'zoom':
+        if len(sys.argv) < 4:
+            print("Error: Please specify a snapshot file and a radius")
+            print("Example: python visualize.py zoom ../outputs/0005.dat 0.1")
+            sys.exit(1)
+        centre = [float(x) for x in sys.argv[4:7]] if len(sys.argv) >= 7 else None
+        plot_zoom_3d(sys.argv[2], float(sys.argv[3]), centre=centre, save=False)
 
     elif command == 'all':
-        plot_all_snapshots()
+        options = dict(zip(sys.argv[2::2], sys.argv[3::2]))
+        plot_all_snapshots(
+            t_min=float(options['--tmin']) if '--tmin' in options else None,
+            t_max=float(options['--tmax']) if '--tmax' in options else None,
+            stride=int(options.get('--stride', 1)),
+            processes=int(options['--workers']) if '--workers' in options else None,
+            budget=int(options.get('--budget', DEFAULT_BUDGET)))
 
     elif command == 'energy':
-        plot_energy_conservation()
+        plot_energy_conservation(follow='--follow' in sys.argv[2:])
 
     else:
         print(f"Unknown command: {command}")
-        print("Available commands: snapshot, all, energy")
+        print("Available commands: snapshot, zoom, all, energy")
         sys.exit(1)
 
 if __name__ == '__main__':
@@ -1,79 +1,30 @@
 import matplotlib.pyplot as plt
-import matplotlib.animation as animation
-from mpl_toolkits.mplot3d import Axes3D
 import numpy as np
-import glob
-import os
 
-def read_dat_file(filename):
-    """Reads a .dat file and returns particle positions and velocities."""
-    with open(filename, 'r') as f:
-        lines = f.readlines()
-        # Skip header (3 lines)
-        data = []
-        for line in lines[3:]:
-            parts = line.split()
-            if len(parts) >= 8:
-                # ID, Mass, X, Y, Z, VX, VY, VZ
-                data.append([float(x) for x in parts[2:8]])
-    return np.array(data)
+from raster import render_movie
+from run_store import RunStore
 
 def generate_animation():
     print("Generating 3D Animation...")
-    files = sorted(glob.glob("../outputs/0*.dat"))
-    if not files:
+    # Memory-mapped (n_snap, N, 6) store; frames are paged in on demand
+    store = RunStore("../outputs")
+    added = store.sync()
+    print(f"Added {added} new snapshots to {store.path}")
+    if not len(store):
         print("No .dat files found!")
         return
-
-    all_data = []
-    for f in files:
-        print(f"Reading {f}...")
-        all_data.append(read_dat_file(f))
-
-    fig = plt.figure(figsize=(10, 10), facecolor='black')
-    ax = fig.add_subplot(111, projection='3d', facecolor='black')
-    
-    # Hide axes
-    ax.set_axis_off()
-    
-    # Initial plot
-    data = all_data[0]
-    # Color by velocity magnitude
-    vel = np.linalg.norm(data[:, 3:], axis=1)
-    # Normalize velocity for color map
-    norm = plt.Normalize(vel.min(), vel.max())
-    
-    scatter = ax.scatter(data[:, 0], data[:, 1], data[:, 2], 
-                        c=vel, cmap='plasma', s=0.5, alpha=0.8, norm=norm)
+    all_data = store.states
 
     # Set limits based on all data to keep scale constant
-    all_pos = np.vstack([d[:, :3] for d in all_data])
-    max_range = np.abs(all_pos).max() * 0.6 # Zoom in a bit
-    
-    ax.set_xlim(-max_range, max_range)
-    ax.set_ylim(-max_range, max_range)
-    ax.set_zlim(-max_range, max_range)
+    max_range = max(np.abs(d[:, :3]).max() for d in all_data) * 0.6 # Zoom in a bit
 
-    def update(frame):
-        data = all_data[frame]
-        scatter._offsets3d = (data[:, 0], data[:, 1], data[:, 2])
-        
-        # Update colors
-        vel = np.linalg.norm(data[:, 3:], axis=1)
-        scatter.set_array(vel)
-        
-        # Rotate view
-        ax.view_init(elev=30, azim=frame * 2)
-        
-        ax.set_title(f"Time Step: {frame}", color='white')
-        return scatter,
-
-    ani = animation.FuncAnimation(fig, update, frames=len(all_data), interval=100, blit=False)
-    
-    # Save as GIF
-    writer = animation.PillowWriter(fps=10)
-    ani.save("../visualizations/nbody_simulation.gif", writer=writer)
-    print("Animation saved to ../visualizations/nbody_simulation.gif")
+    # Rasterised frames coloured by velocity magnitude, rendered in a
+    # process pool (raster.py), rotating 2 degrees per frame
+    output = render_movie([('store', '../outputs', i) for i in range(len(store))],
+                          "../visualizations/nbody_simulation.gif", fps=10,
+                          azim_step=2.0, elev=30.0, extent=max_range,
+                          colour='velocity', cmap='plasma', title='Time: {time:.3f}')
+    print(f"Animation saved to {output}")
 
 def generate_performance_chart():
     print("Generating Performance Chart...")
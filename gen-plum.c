@@ -3,7 +3,8 @@
  * Para Proyecto HPC 2025-I
  *
  * Compilar: gcc -O3 -o gen-plum gen-plum.c -lm
- * Uso: ./gen-plum <N_particles> > data.inp
+ * Uso: ./gen-plum <N_particles> [seed] > data.inp
+ * Sin seed se usa time(NULL) (entradas distintas en cada ejecución)
  */
 
 #include <math.h>
@@ -17,12 +18,12 @@ double rand_val() { return (double)rand() / (double)RAND_MAX; }
 
 int main(int argc, char *argv[]) {
   if (argc < 2) {
-    fprintf(stderr, "Uso: %s <N_particles>\n", argv[0]);
+    fprintf(stderr, "Uso: %s <N_particles> [seed]\n", argv[0]);
     return 1;
   }
 
   int n = atoi(argv[1]);
-  int seed = time(NULL);
+  int seed = (argc > 2) ? atoi(argv[2]) : (int)time(NULL);
   srand(seed);
 
   double t_cur = 0.0;